@@ -0,0 +1,293 @@
+import collections
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import pygame
+
+
+def resource_path(relative_path):
+    try:
+        # PyInstaller creates a temp folder and stores path in _MEIPASS
+        base_path = sys._MEIPASS
+    except Exception:
+        base_path = os.path.abspath(".")
+
+    return os.path.join(base_path, relative_path)
+
+
+PACK_MAGIC = b'MSAP'
+PACK_VERSION = 1
+# magic, version, length of the JSON index that follows. The pixels start after the index, padded to PACK_ALIGNMENT,
+# and every entry's offset is from there
+PACK_HEADER = struct.Struct('<4sHI')
+PACK_ALIGNMENT = 16
+
+
+class AssetPack:
+    '''images baked at their in-game sizes by bake_assets.py, as raw RGBA buffers in one memory-mapped file
+
+    Entries are keyed like ImageCache, with paths relative to resource_path('.'). An entry whose source image has
+    changed since it was baked is ignored, so a stale pack falls back to decoding the PNG.'''
+    def __init__(self, path):
+        self.path = path
+        self.map = None
+        self.start = 0
+        self.index = None
+        # the preload thread and the main thread can both be first to get, only one of them opens the pack
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def make_key(path, size=None, flip_x=False, flip_y=False):
+        relative_path = os.path.relpath(path, resource_path('.')).replace(os.sep, '/')
+        return relative_path, tuple(size) if size else None, bool(flip_x), bool(flip_y)
+
+    def open(self):
+        index = {}
+        pack_map = None
+        start = 0
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                # a private copy-on-write map, as pygame.image.frombuffer wants a writable buffer
+                pack_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+            magic, version, index_size = PACK_HEADER.unpack_from(pack_map)
+            if magic == PACK_MAGIC and version == PACK_VERSION:
+                start = PACK_HEADER.size + index_size
+                start += -start % PACK_ALIGNMENT
+                for entry in json.loads(bytes(pack_map[PACK_HEADER.size:PACK_HEADER.size + index_size])):
+                    size = tuple(entry['size']) if entry['size'] else None
+                    index[entry['path'], size, entry['flip_x'], entry['flip_y']] = entry
+            else:
+                print('ignoring {}, it is not a version {} asset pack'.format(self.path, PACK_VERSION))
+        # built in locals and assigned together, index last, so get never sees a pack that is half open
+        self.map, self.start, self.index = pack_map, start, index
+
+    def get(self, path, size=None, flip_x=False, flip_y=False):
+        '''return a surface over the baked pixels, or None if the image is not in the pack'''
+        if self.index is None:
+            with self.lock:
+                if self.index is None:
+                    self.open()
+        entry = self.index.get(self.make_key(path, size, flip_x, flip_y))
+        if entry is None:
+            return None
+        # a packaged build bakes its pack from the images it bundles, and extracting them changes their mtimes
+        if not getattr(sys, 'frozen', False) and os.path.exists(path):
+            source = os.stat(path)
+            if (source.st_size, source.st_mtime) != tuple(entry['source']):
+                return None
+        width, height = entry['dimensions']
+        offset = self.start + entry['offset']
+        pixels = memoryview(self.map)[offset:offset + width * height * 4]
+        return pygame.image.frombuffer(pixels, (width, height), 'RGBA')
+
+
+class ImageCache:
+    '''LRU cache of loaded, scaled and flipped surfaces converted to the display format'''
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.surfaces = collections.OrderedDict()
+        # surfaces decoded and scaled by a preload thread, still waiting to be converted on the main thread
+        self.prepared = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(path, size=None, flip_x=False, flip_y=False):
+        return path, tuple(size) if size else None, bool(flip_x), bool(flip_y)
+
+    def get(self, path, size=None, flip_x=False, flip_y=False):
+        key = self.make_key(path, size, flip_x, flip_y)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+
+        self.misses += 1
+        surface = self.prepared.pop(key, None)
+        if surface is None:
+            surface = asset_pack.get(*key)
+        if surface is not None:
+            if pygame.display.get_surface() is not None:
+                surface = surface.convert_alpha()
+        else:
+            # a variant is made from a source that is not cached, so a large image is not kept at full size for the
+            # sake of its smaller variants
+            surface = self.surfaces.get(self.make_key(path))
+            if surface is None:
+                surface = pygame.image.load(path)
+            if size:
+                surface = pygame.transform.scale(surface, key[1])
+            if flip_x or flip_y:
+                surface = pygame.transform.flip(surface, key[2], key[3])
+            if pygame.display.get_surface() is not None:
+                surface = surface.convert_alpha()
+
+        self.surfaces[key] = surface
+        while len(self.surfaces) > self.maxsize:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def prepare(self, path, size=None, flip_x=False, flip_y=False):
+        '''decode and scale an image without touching the display, safe to call from another thread'''
+        key = self.make_key(path, size, flip_x, flip_y)
+        if key in self.surfaces or key in self.prepared:
+            return
+        if asset_pack.get(*key) is not None:
+            # nothing to decode, get converts straight from the pack
+            return
+        surface = pygame.image.load(path)
+        if size:
+            surface = pygame.transform.scale(surface, key[1])
+        if flip_x or flip_y:
+            surface = pygame.transform.flip(surface, key[2], key[3])
+        self.prepared[key] = surface
+
+    def clear(self):
+        self.surfaces.clear()
+        self.prepared.clear()
+
+
+class RotationCache:
+    '''LRU cache of rotated surfaces, with angles snapped to a multiple of step degrees
+
+    Bounded by the bytes of the surfaces it holds rather than their number, as one large image rotated through every
+    angle can take as much memory as thousands of small ones.'''
+    def __init__(self, step=2, max_bytes=64 * 2 ** 20):
+        self.step = step
+        self.max_bytes = max_bytes
+        self.rotations = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+
+    def get(self, surface, angle_degrees):
+        '''return the rotated surface and the offset from its top left corner to its center'''
+        angle = round(angle_degrees / self.step) * self.step % 360
+        key = (surface, angle)
+        entry = self.rotations.get(key)
+        if entry is not None:
+            self.rotations.move_to_end(key)
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        rotated = pygame.transform.rotate(surface, angle)
+        entry = rotated, (rotated.get_width() / 2, rotated.get_height() / 2)
+        self.rotations[key] = entry
+        self.bytes += surface_bytes(rotated)
+        while self.bytes > self.max_bytes and len(self.rotations) > 1:
+            _, (evicted, _) = self.rotations.popitem(last=False)
+            self.bytes -= surface_bytes(evicted)
+        return entry
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'step': self.step,
+                'entries': len(self.rotations),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.,
+                'bytes': self.bytes,
+                }
+
+    def clear(self):
+        self.rotations.clear()
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+
+
+class Audio:
+    '''mixer settings, the streamed music track and effect playback
+
+    Music is streamed from disk by pygame.mixer.music instead of being decoded into a Sound. With enabled False the
+    mixer is kept closed, nothing is loaded and playing does nothing, for headless simulations.'''
+    def __init__(self, frequency=44100, buffer=512, enabled=True):
+        self.frequency = frequency
+        self.buffer = buffer
+        self.enabled = enabled
+        self.music = None
+
+    def configure(self, frequency=None, buffer=None, enabled=None):
+        '''change the settings, before pygame.init so it opens the mixer with them
+
+        pygame.init opens the mixer even when audio is disabled, so disable it after pygame.init to close the mixer.'''
+        if frequency is not None:
+            self.frequency = frequency
+        if buffer is not None:
+            self.buffer = buffer
+        if enabled is not None:
+            self.enabled = enabled
+        if self.enabled:
+            pygame.mixer.pre_init(self.frequency, -16, 2, self.buffer)
+        elif pygame.mixer.get_init():
+            pygame.mixer.quit()
+            self.music = None
+
+    def init(self):
+        '''open the mixer if audio is enabled, returning whether it is open'''
+        if not self.enabled:
+            return False
+        if not pygame.mixer.get_init():
+            pygame.mixer.init(self.frequency, -16, 2, self.buffer)
+        return True
+
+    def play_music(self, path, volume=1., loops=-1):
+        '''play path from the start, only opening it again if a different track was playing'''
+        if not self.init():
+            return
+        if self.music != path:
+            pygame.mixer.music.load(path)
+            self.music = path
+        pygame.mixer.music.set_volume(volume)
+        pygame.mixer.music.play(loops)
+
+    def play(self, sound, channel):
+        if sound is not None and self.enabled and pygame.mixer.get_init():
+            pygame.mixer.Channel(channel).play(sound)
+
+
+def surface_bytes(surface):
+    return surface.get_width() * surface.get_height() * surface.get_bytesize()
+
+
+asset_pack = AssetPack(resource_path('assets.pack'))
+image_cache = ImageCache()
+rotation_cache = RotationCache()
+sound_cache = {}
+audio = Audio()
+
+
+def load_image(path, size=None, flip_x=False, flip_y=False):
+    '''return a shared surface for path at size; callers must not draw on it'''
+    return image_cache.get(path, size, flip_x, flip_y)
+
+
+def load_sound(path):
+    '''return a shared Sound for a short effect, or None with audio disabled'''
+    if not audio.init():
+        return None
+    sound = sound_cache.get(path)
+    if sound is None:
+        sound = sound_cache[path] = pygame.mixer.Sound(path)
+    return sound
+
+
+def preload(images=(), sounds=()):
+    '''decode images and sounds on a background thread so that loading them later is a cache hit
+
+    images are (path, size, flip_x, flip_y) tuples. Sounds are only preloaded once the mixer is initialized.'''
+    def run():
+        for image in images:
+            image_cache.prepare(*image)
+        if audio.enabled and pygame.mixer.get_init():
+            for path in sounds:
+                load_sound(path)
+
+    thread = threading.Thread(target=run, name='preload', daemon=True)
+    thread.start()
+    return thread
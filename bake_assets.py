@@ -0,0 +1,73 @@
+"""Bake every image the game loads, at the sizes it loads them, into assets.pack for assets.AssetPack.
+
+The pack holds a small header, a JSON index and the raw RGBA pixels of each image, so the game can build surfaces
+straight from a memory map instead of decoding and scaling PNGs. Run it before building with PyInstaller:
+
+    python bake_assets.py
+"""
+import os
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import argparse
+import json
+import pygame as pg
+
+from assets import AssetPack, PACK_ALIGNMENT, PACK_HEADER, PACK_MAGIC, PACK_VERSION, resource_path
+from main import Game, Menu
+
+
+def render(path, size=None, flip_x=False, flip_y=False):
+    '''decode, scale and flip an image the way ImageCache does'''
+    surface = pg.image.load(path)
+    if size:
+        surface = pg.transform.scale(surface, tuple(size))
+    if flip_x or flip_y:
+        surface = pg.transform.flip(surface, bool(flip_x), bool(flip_y))
+    return surface
+
+
+def bake(path, images):
+    index = []
+    buffers = []
+    offset = 0
+    for image in images:
+        source = image[0]
+        if not os.path.exists(source):
+            print('skipping missing', source)
+            continue
+        surface = render(*image)
+        relative_path, size, flip_x, flip_y = AssetPack.make_key(*image)
+        stat = os.stat(source)
+        index.append({'path': relative_path, 'size': size, 'flip_x': flip_x, 'flip_y': flip_y,
+                      'dimensions': surface.get_size(), 'source': (stat.st_size, stat.st_mtime), 'offset': offset})
+        pixels = pg.image.tostring(surface, 'RGBA')
+        padding = -len(pixels) % PACK_ALIGNMENT
+        buffers.append(pixels + bytes(padding))
+        offset += len(pixels) + padding
+
+    encoded_index = json.dumps(index).encode()
+    start = PACK_HEADER.size + len(encoded_index)
+    with open(path, 'wb') as f:
+        f.write(PACK_HEADER.pack(PACK_MAGIC, PACK_VERSION, len(encoded_index)))
+        f.write(encoded_index)
+        f.write(bytes(-start % PACK_ALIGNMENT))
+        for pixels in buffers:
+            f.write(pixels)
+    print('baked {} images, {:.1f} MB, into {}'.format(len(index), (start + offset) / 2 ** 20, path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', default=resource_path('assets.pack'))
+    args = parser.parse_args()
+
+    pg.init()
+    images = list(dict.fromkeys(tuple(image) for image in Menu.images() + Game.images()))
+    bake(args.output, images)
+    pg.quit()
+
+
+if __name__ == '__main__':
+    main()
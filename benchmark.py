@@ -0,0 +1,151 @@
+"""Headless, deterministic frame-time benchmark for the Game state.
+
+Runs a Game without a window (SDL dummy drivers) for a fixed number of frames with one seed shared by
+`random` and `np.random`, and reports frame-time percentiles and a per-phase breakdown.
+
+    python benchmark.py --scenario all --frames 600 --seed 0
+"""
+import os
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import argparse
+import collections
+import random
+import numpy as np
+import pygame as pg
+
+from assets import audio, rotation_cache
+from main import Game
+from profiler import profiler
+from quality import LEVELS, quality
+
+
+# player_speed carries the player along the level at that many px/s, 2,000 crosses the long level in 600 frames
+SCENARIOS = {
+    'default': {},
+    'debris': {'debris_count': 1000},
+    'long': {'level_end': 20000, 'background_width': 22000, 'player_speed': 2000},
+}
+
+# the profiler phases a Game frame goes through, event polling is Control's
+PHASES = ('spawn', 'update', 'step', 'background', 'sprites')
+
+
+def seed_everything(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+def run_scenario(name, frames=600, seed=0, dt=1 / 60., rotation_step=None, quality_level=0, physics_iterations=10,
+                 spatial_hash=None):
+    '''run one scenario and return a dict of per-frame and per-phase timings in milliseconds'''
+    params = dict(SCENARIOS[name])
+    debris_count = params.pop('debris_count', 0)
+    player_speed = params.pop('player_speed', 0)
+    # no keys are held, whatever the keyboard says, so every run plays out the same
+    held = collections.defaultdict(bool)
+
+    seed_everything(seed)
+    rotation_cache.clear()
+    quality.level = quality_level
+    rotation_cache.step = rotation_step or quality.get('rotation_step')
+    game = Game(physics_iterations=physics_iterations, spatial_hash=spatial_hash, **params)
+    game.input = lambda: held
+    game.startup()
+    start, steps = game.player.body.position, 0
+    screen = game.screen
+    timings = {phase: np.zeros(frames) for phase in PHASES + ('frame',)}
+    bodies = np.zeros((frames, 2), dtype=int)
+    restarts = 0
+    furthest = 0
+
+    for frame in range(frames):
+        if game.done:
+            game.done = False
+            game.startup()
+            start, steps = game.player.body.position, 0
+            restarts += 1
+        missing_debris = max(debris_count - len(game.debris), 0)
+
+        # the same calls Control makes for a frame with one physics step, timed by the game's own profiler phases
+        profiler.begin_frame()
+        if missing_debris:
+            with profiler.phase('spawn'):
+                game.add_debris(missing_debris)
+        if player_speed:
+            # moved along at its starting height rather than flown, so it always gets through the whole level
+            game.player.body.position = start.x + player_speed * dt * steps, start.y
+            game.player.body.velocity = player_speed, 0
+            steps += 1
+        game.fixed_update(dt)
+        if not game.done:
+            game.draw(screen)
+        profiler.end_frame()
+        # counted outside the frame, it walks every body
+        if not game.done:
+            furthest = max(furthest, game.player.pos.x)
+            bodies[frame] = len(game.space.bodies), sum(not body.is_sleeping for body in game.space.bodies)
+
+        for phase in PHASES:
+            timings[phase][frame] = profiler.current[phase]
+        timings['frame'][frame] = profiler.current['total']
+
+    timings = {phase: values * 1000 for phase, values in timings.items()}
+    timings['restarts'] = restarts
+    timings['furthest'] = furthest
+    timings['rotations'] = rotation_cache.stats()
+    timings['pool'] = game.debris_pool.stats()
+    timings['bodies'] = bodies
+    game.release_world()
+    return timings
+
+
+def report(name, timings):
+    frame = timings['frame']
+    p50, p95, p99 = np.percentile(frame, [50, 95, 99])
+    print('{}: {} frames, {} restarts, player reached x={:.0f}'.format(name, len(frame), timings['restarts'],
+                                                                     timings['furthest']))
+    print('  frame   p50 {:8.3f} ms  p95 {:8.3f} ms  p99 {:8.3f} ms'.format(p50, p95, p99))
+    for phase in PHASES:
+        values = timings[phase]
+        share = 100 * values.sum() / frame.sum() if frame.sum() else 0
+        print('  {:<10} mean {:7.3f} ms  p95 {:8.3f} ms  {:5.1f}%'.format(phase, values.mean(),
+                                                                       np.percentile(values, 95), share))
+    bodies, awake = timings['bodies'].mean(axis=0)
+    print('  physics: {:.0f} bodies, {:.0f} awake on average'.format(bodies, awake))
+    rotations = timings['rotations']
+    print('  rotation cache: step {}deg, hit rate {:.1%}, {} surfaces, {:.1f} MB'.format(
+        rotations['step'], rotations['hit_rate'], rotations['entries'], rotations['bytes'] / 2 ** 20))
+    pool = timings['pool']
+    print('  debris pool: {} reused, {} misses, {} dropped, {} free'.format(
+        pool['reused'], pool['misses'], pool['dropped'], pool['free']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenario', default='all', choices=['all'] + list(SCENARIOS))
+    parser.add_argument('--frames', type=int, default=600)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--rotation-step', type=float, default=None,
+                        help='rotation cache angle step in degrees, defaults to the quality level\'s')
+    parser.add_argument('--quality', type=int, default=0, choices=range(len(LEVELS)),
+                        help='adaptive quality level to run at, 0 is full quality')
+    parser.add_argument('--iterations', type=int, default=10, help='physics solver iterations')
+    parser.add_argument('--spatial-hash', type=float, nargs=2, metavar=('CELL_SIZE', 'COUNT'), default=None,
+                        help='use the spatial hash broadphase instead of the bounding box tree')
+    args = parser.parse_args()
+
+    pg.init()
+    audio.configure(enabled=False)
+    names = list(SCENARIOS) if args.scenario == 'all' else [args.scenario]
+    for name in names:
+        report(name, run_scenario(name, frames=args.frames, seed=args.seed, rotation_step=args.rotation_step,
+                                    quality_level=args.quality, physics_iterations=args.iterations,
+                                    spatial_hash=args.spatial_hash))
+    pg.quit()
+
+
+if __name__ == '__main__':
+    main()
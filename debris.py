@@ -0,0 +1,206 @@
+import collections
+import numpy as np
+import pygame
+from assets import resource_path
+from game_objects import Satellite
+
+
+# debris are snapped to a few sizes so pooled objects can be reused for any spawn
+SPUTNIK_SIZES = (16, 20, 24)
+GOLD_SATELLITE_SIZES = (38, 45, 52)
+
+
+def size_classes(sizes, classes):
+    '''snap each of sizes to the nearest of classes'''
+    classes = np.asarray(classes)
+    return classes[np.abs(np.asarray(sizes)[:, None] - classes).argmin(axis=1)]
+
+
+def sample_debris(n, x_min, x_max, player_x):
+    '''draw the spawn parameters of n pieces of debris at once'''
+    is_sputnik = np.random.random_sample(n) <= 0.8
+    size = np.where(is_sputnik,
+                    size_classes(np.random.uniform(15, 25, n), SPUTNIK_SIZES),
+                    size_classes(np.random.uniform(35, 55, n), GOLD_SATELLITE_SIZES))
+    return {'x': np.random.uniform(x_min, x_max, n),
+            'velocity_x': np.random.uniform(-5, 5, n),
+            'velocity_y': -100 - np.random.lognormal(1, 3 + player_x / 500., n),
+            'angular_velocity': np.random.uniform(-10, 10, n),
+            'is_sputnik': is_sputnik,
+            'size': size,
+            }
+
+
+class DebrisPool:
+    '''free lists of Satellites, bucketed by image, size, mass and kind, that are reset instead of rebuilt
+
+    Geosynch satellites are pooled too. The pool outlives a run: set space to the next run's space and satellites
+    freed in the last run are moved into it as they are acquired. Bodies keep what Chipmunk holds internally from
+    their last run, so only runs that start from a new pool are repeatable, as replay.Recorder and Replay do.'''
+    def __init__(self, space, capacity=256, screen_height=None):
+        self.space = space
+        self.capacity = capacity
+        self.screen_height = screen_height
+        self.free = collections.defaultdict(list)
+        self.n_free = 0
+        self.reused = 0
+        self.misses = 0
+        self.dropped = 0
+
+    @staticmethod
+    def make_key(image_filename, image_shape=None, mass=1, is_geosynch=False):
+        return image_filename, tuple(image_shape) if image_shape else None, mass, is_geosynch
+
+    def acquire(self, image_filename, image_shape=None, mass=1, init_pos=(0, 0), init_velocity=(0, 0),
+                init_angular_velocity=0, is_geosynch=False):
+        key = self.make_key(image_filename, image_shape, mass, is_geosynch)
+        free = self.free[key]
+        if free:
+            satellite = free.pop()
+            self.n_free -= 1
+            self.reused += 1
+            satellite.space = self.space
+            satellite.reset(init_pos, init_velocity, init_angular_velocity)
+        else:
+            self.misses += 1
+            satellite = self.build(key, self.space, init_pos, init_velocity, init_angular_velocity)
+        satellite.pool = self
+        return satellite
+
+    def build(self, key, space, init_pos=(0, 0), init_velocity=(0, 0), init_angular_velocity=0):
+        image_filename, image_shape, mass, is_geosynch = key
+        satellite = Satellite(space, image_filename, init_pos=init_pos, init_velocity=init_velocity,
+                              mass=mass, image_shape=image_shape, is_geosynch=is_geosynch,
+                              screen_height=self.screen_height, init_angular_velocity=init_angular_velocity)
+        satellite.pool_key = key
+        return satellite
+
+    def release(self, satellite):
+        '''take back a satellite that has already been removed from the space and its groups'''
+        satellite.pool = None
+        if self.n_free >= self.capacity:
+            self.dropped += 1
+            return
+        self.free[satellite.pool_key].append(satellite)
+        self.n_free += 1
+
+    def prefill(self, image_filename, image_shape=None, mass=1, count=1, is_geosynch=False):
+        '''build satellites until count are free, outside the space'''
+        key = self.make_key(image_filename, image_shape, mass, is_geosynch)
+        for _ in range(count - len(self.free[key])):
+            self.release(self.build(key, None))
+
+    def stats(self):
+        return {'free': self.n_free,
+                'reused': self.reused,
+                'misses': self.misses,
+                'dropped': self.dropped,
+                }
+
+
+class DebrisField:
+    '''live debris, with their state held in NumPy arrays indexed by slot
+
+    The arrays are synced from the pymunk bodies once per physics step so culling and drawing work on whole arrays
+    instead of calling into every Satellite.'''
+    def __init__(self, pool, capacity=256):
+        self.pool = pool
+        self.group = pygame.sprite.Group()
+        self.satellites = []
+        self.free_slots = []
+        self.alive = np.zeros(0, dtype=bool)
+        self.positions = np.zeros((0, 2))
+        self.previous_positions = np.zeros((0, 2))
+        self.velocities = np.zeros((0, 2))
+        self.angles = np.zeros(0)
+        self.previous_angles = np.zeros(0)
+        self.sizes = np.zeros((0, 2))
+        self.grow(capacity)
+
+    def __len__(self):
+        return len(self.group)
+
+    def grow(self, capacity):
+        old_capacity = len(self.satellites)
+        extra = capacity - old_capacity
+        self.satellites.extend([None] * extra)
+        self.free_slots.extend(range(capacity - 1, old_capacity - 1, -1))
+        self.alive = np.concatenate([self.alive, np.zeros(extra, dtype=bool)])
+        for name in ('positions', 'previous_positions', 'velocities', 'sizes'):
+            setattr(self, name, np.concatenate([getattr(self, name), np.zeros((extra, 2))]))
+        for name in ('angles', 'previous_angles'):
+            setattr(self, name, np.concatenate([getattr(self, name), np.zeros(extra)]))
+
+    def add(self, satellite):
+        if not self.free_slots:
+            self.grow(2 * len(self.satellites))
+        slot = satellite.slot = self.free_slots.pop()
+        self.satellites[slot] = satellite
+        self.alive[slot] = True
+        body = satellite.body
+        self.positions[slot] = self.previous_positions[slot] = tuple(body.position)
+        self.velocities[slot] = tuple(body.velocity)
+        self.angles[slot] = self.previous_angles[slot] = body.angle
+        self.sizes[slot] = satellite.rect.size
+        self.group.add(satellite)
+
+    def spawn(self, n, x_min, x_max, player_x, y=-10):
+        '''drop n new pieces of debris between x_min and x_max'''
+        params = sample_debris(n, x_min, x_max, player_x)
+        for x, velocity_x, velocity_y, angular_velocity, is_sputnik, size in zip(
+                params['x'], params['velocity_x'], params['velocity_y'], params['angular_velocity'],
+                params['is_sputnik'], params['size'].tolist()):
+            if is_sputnik:
+                satellite = self.pool.acquire(resource_path("images/sputnik_custom.png"), (size, size),
+                                              init_pos=(x, y), init_velocity=(velocity_x, velocity_y),
+                                              init_angular_velocity=angular_velocity)
+            else:
+                satellite = self.pool.acquire(resource_path("images/gold_satellite.png"), (3 * size, size), mass=5,
+                                              init_pos=(x, y), init_velocity=(velocity_x, velocity_y),
+                                              init_angular_velocity=angular_velocity)
+            self.add(satellite)
+
+    def remove(self, satellite):
+        slot = satellite.slot
+        satellite.slot = None
+        self.satellites[slot] = None
+        self.alive[slot] = False
+        self.free_slots.append(slot)
+        satellite.despawn()
+
+    def save_previous(self):
+        self.previous_positions[:] = self.positions
+        self.previous_angles[:] = self.angles
+
+    def sync(self):
+        '''copy position, velocity and angle of every live body into the arrays'''
+        slots = np.flatnonzero(self.alive)
+        if not len(slots):
+            return
+        bodies = [self.satellites[slot].body for slot in slots]
+        state = np.array([(p.x, p.y, v.x, v.y, body.angle)
+                          for body, p, v in ((body, body.position, body.velocity) for body in bodies)])
+        self.positions[slots] = state[:, :2]
+        self.velocities[slots] = state[:, 2:4]
+        self.angles[slots] = state[:, 4]
+
+    def cull(self, min_x, screen_height):
+        '''remove debris that fell off the level or that is more than a screen behind min_x'''
+        left = self.positions[:, 0] - self.sizes[:, 0] / 2
+        top = -self.positions[:, 1] + 500 - self.sizes[:, 1] / 2
+        gone = self.alive & ((top > screen_height) | (top < -100) | (left + 500 < min_x))
+        for slot in np.flatnonzero(gone):
+            self.remove(self.satellites[slot])
+
+    def interpolate(self, alpha):
+        '''return the live slots and their positions and angles alpha of the way through the last step'''
+        slots = np.flatnonzero(self.alive)
+        positions = self.previous_positions[slots]
+        positions += (self.positions[slots] - positions) * alpha
+        angles = self.previous_angles[slots]
+        angles += (self.angles[slots] - angles) * alpha
+        return slots, positions, angles
+
+    def clear(self):
+        for satellite in list(self.group):
+            self.remove(satellite)
@@ -0,0 +1,74 @@
+import pygame
+
+
+class Display:
+    '''the window, and the fixed-resolution surface everything is drawn to
+
+    When the window is bigger or smaller than the resolution, the surface is scaled to fill as much of it as keeps
+    the aspect ratio, once per frame, so the cost of drawing a frame doesn't grow with the window. Integer scaling
+    keeps pixels sharp and leaves a wider border when the window isn't a whole multiple of the resolution; smooth
+    scaling stretches to any size.'''
+    def __init__(self, resolution=(500, 500), window_size=None, smooth=False):
+        self.scaled_rect = None
+        self.configure(resolution, window_size, smooth)
+
+    def configure(self, resolution=(500, 500), window_size=None, smooth=False):
+        '''change the settings, before the first Control is made'''
+        self.resolution = tuple(resolution)
+        self.window_size = tuple(window_size) if window_size else None
+        self.smooth = smooth
+        self.window = self.screen = None
+
+    def get_screen(self):
+        '''the surface to draw to, opening the window the first time'''
+        if self.screen is None:
+            self.open()
+        return self.screen
+
+    def open(self):
+        self.window = pygame.display.set_mode(self.window_size or self.resolution)
+        window_width, window_height = self.window.get_size()
+        width, height = self.resolution
+        if (window_width, window_height) == (width, height):
+            self.screen = self.window
+            self.scaled_rect = self.window.get_rect()
+            return
+
+        self.screen = pygame.Surface(self.resolution).convert()
+        scale = min(window_width / width, window_height / height)
+        if not self.smooth and scale >= 1:
+            scale = int(scale)
+        self.scaled_rect = pygame.Rect(0, 0, round(width * scale), round(height * scale))
+        self.scaled_rect.center = self.window.get_rect().center
+        self.window.fill((0, 0, 0))
+        pygame.display.update()
+
+    def present(self, dirty_rects=None):
+        '''show the frame, dirty_rects are the areas of the screen that changed, or None for all of it'''
+        if self.screen is self.window:
+            if dirty_rects is None:
+                pygame.display.update()
+            elif dirty_rects:
+                pygame.display.update(dirty_rects)
+            return
+        if dirty_rects is not None and not dirty_rects:
+            return
+        target = self.window.subsurface(self.scaled_rect)
+        if self.smooth:
+            pygame.transform.smoothscale(self.screen, self.scaled_rect.size, target)
+        else:
+            pygame.transform.scale(self.screen, self.scaled_rect.size, target)
+        pygame.display.update(self.scaled_rect)
+
+    def to_screen(self, position):
+        '''map a window position, like the mouse's, to the screen'''
+        x, y = position
+        width, height = self.resolution
+        rect = self.scaled_rect
+        return int((x - rect.x) * width / rect.width), int((y - rect.y) * height / rect.height)
+
+    def mouse_pos(self):
+        return self.to_screen(pygame.mouse.get_pos())
+
+
+display = Display()
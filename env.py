@@ -0,0 +1,205 @@
+"""reset()/step(action) environments around Game, for automated difficulty tuning and agent training.
+
+MoonshotEnv runs one game headless with a fixed timestep. VectorEnv runs N of them in worker processes that write their
+observations into one shared-memory array. Running this module measures how steps/sec scale with the number of workers:
+
+    python env.py --envs 1 2 4 8 --steps 2000
+"""
+import os
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import argparse
+import collections
+import multiprocessing as mp
+import random
+import time
+import numpy as np
+import pygame as pg
+
+from assets import audio
+from main import Game
+
+
+# actions are bitmasks of the keys Player.update reads
+JUMP = 1
+LEFT = 2
+RIGHT = 4
+N_ACTIONS = 8
+
+N_SATELLITES = 4
+N_DEBRIS = 8
+# player x, y, vx, vy, can_jump, in_contact, moon dx, dy; then dx, dy, present for the nearest geosynch satellites
+# and dx, dy, vx, vy, present for the nearest debris. Positions are in screen coordinates relative to the player and
+# divided by 1000, velocities are divided by 100.
+OBS_SIZE = 8 + 3 * N_SATELLITES + 5 * N_DEBRIS
+
+
+class MoonshotEnv:
+    '''a Game driven by actions instead of the keyboard, stepped without rendering'''
+    def __init__(self, level_end=3000, frame_skip=4, max_steps=5000, physics_rate=60):
+        if not pg.get_init():
+            pg.init()
+        audio.configure(enabled=False)
+        self.game = Game(level_end=level_end)
+        self.game.input = self.get_keys
+        self.keys = collections.defaultdict(bool)
+        self.frame_skip = frame_skip
+        self.max_steps = max_steps
+        self.dt = 1. / physics_rate
+        self.steps = 0
+        self.last_observation = None
+
+    def get_keys(self):
+        return self.keys
+
+    def reset(self, seed=None):
+        if seed is not None:
+            random.seed(seed)
+            np.random.seed(seed)
+        self.game.done = False
+        self.game.startup()
+        self.steps = 0
+        self.last_observation = self.observe()
+        return self.last_observation
+
+    def step(self, action):
+        '''hold the keys in action for frame_skip physics steps, returning (observation, reward, done, info)'''
+        self.keys[pg.K_w] = bool(action & JUMP)
+        self.keys[pg.K_a] = bool(action & LEFT)
+        self.keys[pg.K_d] = bool(action & RIGHT)
+
+        game = self.game
+        start_x = game.player.body.position.x
+        for _ in range(self.frame_skip):
+            game.fixed_update(self.dt)
+            if game.done:
+                break
+        self.steps += 1
+
+        if game.done:
+            # fell out of the level, the game has already thrown the player away
+            return self.last_observation, -1., True, {'reached_moon': False}
+
+        reward = (game.player.body.position.x - start_x) / 100
+        reached_moon = game.player.game_over
+        if reached_moon:
+            reward += 10
+        self.last_observation = self.observe()
+        done = reached_moon or self.steps >= self.max_steps
+        return self.last_observation, reward, done, {'reached_moon': reached_moon}
+
+    def observe(self):
+        game = self.game
+        body = game.player.body
+        x, y = body.position.x, -body.position.y + 500
+        observation = np.zeros(OBS_SIZE, dtype=np.float32)
+        observation[:8] = (x / 1000, y / 1000, body.velocity.x / 100, -body.velocity.y / 100,
+                           game.player.can_jump, game.player.in_contact,
+                           (game.moon_center[0] - x) / 1000, (game.moon_center[1] - y) / 1000)
+
+        satellites = np.array([(s.pos.x - x, s.pos.y - y) for s in game.sprites if s.is_geosynch]).reshape(-1, 2)
+        nearest = np.argsort((satellites ** 2).sum(axis=1))[:N_SATELLITES]
+        block = observation[8:8 + 3 * N_SATELLITES].reshape(N_SATELLITES, 3)
+        block[:len(nearest), :2] = satellites[nearest] / 1000
+        block[:len(nearest), 2] = 1
+
+        debris = game.debris
+        slots = np.flatnonzero(debris.alive)
+        offsets = np.column_stack([debris.positions[slots, 0] - x, -debris.positions[slots, 1] + 500 - y])
+        nearest = slots[np.argsort((offsets ** 2).sum(axis=1))[:N_DEBRIS]]
+        block = observation[8 + 3 * N_SATELLITES:].reshape(N_DEBRIS, 5)
+        block[:len(nearest), 0] = (debris.positions[nearest, 0] - x) / 1000
+        block[:len(nearest), 1] = (-debris.positions[nearest, 1] + 500 - y) / 1000
+        block[:len(nearest), 2] = debris.velocities[nearest, 0] / 100
+        block[:len(nearest), 3] = -debris.velocities[nearest, 1] / 100
+        block[:len(nearest), 4] = 1
+        return observation
+
+
+def worker(remote, shared_observations, index, env_kwargs):
+    env = MoonshotEnv(**env_kwargs)
+    observations = np.frombuffer(shared_observations, dtype=np.float32).reshape(-1, OBS_SIZE)
+    while True:
+        command, data = remote.recv()
+        if command == 'step':
+            observation, reward, done, info = env.step(data)
+            if done:
+                info['terminal_observation'] = observation
+                observation = env.reset()
+            observations[index] = observation
+            remote.send((reward, done, info))
+        elif command == 'reset':
+            observations[index] = env.reset(data)
+            remote.send(None)
+        elif command == 'close':
+            remote.close()
+            break
+
+
+class VectorEnv:
+    '''n MoonshotEnvs in their own processes, writing observations into one shared array
+
+    Environments that finish are reset straight away; the final observation is in info['terminal_observation'].'''
+    def __init__(self, n_envs, seed=0, **env_kwargs):
+        context = mp.get_context('spawn')
+        self.n_envs = n_envs
+        self.seed = seed
+        self.shared_observations = context.RawArray('f', n_envs * OBS_SIZE)
+        self.observations = np.frombuffer(self.shared_observations, dtype=np.float32).reshape(n_envs, OBS_SIZE)
+        self.remotes, worker_remotes = zip(*[context.Pipe() for _ in range(n_envs)])
+        self.processes = [context.Process(target=worker, args=(worker_remote, self.shared_observations, i, env_kwargs),
+                                          daemon=True)
+                          for i, worker_remote in enumerate(worker_remotes)]
+        for process, worker_remote in zip(self.processes, worker_remotes):
+            process.start()
+            worker_remote.close()
+
+    def reset(self):
+        for i, remote in enumerate(self.remotes):
+            remote.send(('reset', self.seed + i))
+        for remote in self.remotes:
+            remote.recv()
+        return self.observations.copy()
+
+    def step(self, actions):
+        for remote, action in zip(self.remotes, actions):
+            remote.send(('step', int(action)))
+        rewards, dones, infos = zip(*[remote.recv() for remote in self.remotes])
+        return self.observations.copy(), np.array(rewards, dtype=np.float32), np.array(dones), list(infos)
+
+    def close(self):
+        for remote in self.remotes:
+            remote.send(('close', None))
+        for process in self.processes:
+            process.join()
+
+
+def measure(n_envs, steps, seed=0):
+    env = VectorEnv(n_envs, seed=seed)
+    env.reset()
+    rng = np.random.RandomState(seed)
+    start = time.perf_counter()
+    for _ in range(steps):
+        env.step(rng.randint(N_ACTIONS, size=n_envs))
+    elapsed = time.perf_counter() - start
+    env.close()
+    return n_envs * steps / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--envs', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--steps', type=int, default=2000)
+    args = parser.parse_args()
+
+    baseline = None
+    for n_envs in args.envs:
+        steps_per_second = measure(n_envs, args.steps)
+        baseline = baseline or steps_per_second
+        print('{:3d} envs: {:9.0f} steps/sec  ({:.2f}x)'.format(n_envs, steps_per_second, steps_per_second / baseline))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,33 +1,46 @@
 import pygame
 import pymunk
 import numpy as np
-import os
-import sys
+from assets import audio, load_image, resource_path
 
 
-def resource_path(relative_path):
-    try:
-        # PyInstaller creates a temp folder and stores path in _MEIPASS
-        base_path = sys._MEIPASS
-    except Exception:
-        base_path = os.path.abspath(".")
+COLLISION_PLAYER = 1
+COLLISION_GEOSYNCH = 2
+COLLISION_DEBRIS = 3
 
-    return os.path.join(base_path, relative_path)
+
+def get_body_state(body):
+    '''everything needed to put a body back where it was, see set_body_state'''
+    return (tuple(body.position), tuple(body.velocity), body.angle, body.angular_velocity, tuple(body.force),
+            body.torque, body.is_sleeping)
+
+
+def set_body_state(body, state):
+    '''restore a body saved with get_body_state, it has to be in a space that is not stepping'''
+    position, velocity, angle, angular_velocity, force, torque, is_sleeping = state
+    body.position = position
+    body.velocity = velocity
+    body.angle = angle
+    body.angular_velocity = angular_velocity
+    body.force = force
+    body.torque = torque
+    if is_sleeping:
+        body.sleep()
 
 
 class Player(pygame.sprite.Sprite):
     def __init__(self, space, init_pos=(0, 0), image_shape=None, is_player=True, is_geosynch=False, moon_center=(0, 0),
-                 boost_sound=None):
+                 boost_sound=None, get_pressed=None):
         super().__init__()
         self.game_over = False
+        # returns the held keys indexed by key constant, like pygame.key.get_pressed
+        self.get_pressed = get_pressed or pygame.key.get_pressed
         self.rocket_boost_sound = boost_sound
         self.is_geosynch = is_geosynch
         self.is_player = is_player
-        self.image = pygame.image.load(resource_path("images/catstronaut.png"))
+        self.image = load_image(resource_path("images/catstronaut.png"), image_shape,
+                                flip_x=bool(image_shape), flip_y=bool(image_shape))
         self.moon_center = moon_center
-        if image_shape:
-            self.image = pygame.transform.scale(self.image, image_shape)
-            self.image = pygame.transform.flip(self.image, True, True)
         self.rect = self.image.get_bounding_rect()
         width = self.rect.width
         height = self.rect.height
@@ -43,14 +56,17 @@ class Player(pygame.sprite.Sprite):
         self.body.position = self.pos.x, -self.pos.y + 500
         self.shape = pymunk.Poly(self.body, vs)
         self.shape.friction = 0.5
+        self.shape.collision_type = COLLISION_PLAYER
+        self.shape.sprite = self
         self.space.add(self.body, self.shape)
+        self.previous_position, self.previous_angle = self.body.position, self.body.angle
         self.can_jump = True
+        # set by the physics collision handler whenever the player touched anything during the last step
+        self.in_contact = False
 
     def update(self, events, dt, other_sprites=None):
-        pressed = pygame.key.get_pressed()
-        non_player_sprites = other_sprites.copy()
-        non_player_sprites.remove(self)
-        is_collided = pygame.sprite.spritecollideany(self, non_player_sprites)
+        pressed = self.get_pressed()
+        is_collided = self.in_contact
         lateral_strength = 20 if is_collided else 5
         if self.game_over is False:
             if is_collided:
@@ -60,7 +76,7 @@ class Player(pygame.sprite.Sprite):
                 if pressed[pygame.K_w] and self.body.velocity[1] < 10 and self.can_jump:
                     self.can_jump = False
                     move += pygame.Vector2((0, 1)) * 300
-                    pygame.mixer.Channel(1).play(self.rocket_boost_sound)
+                    audio.play(self.rocket_boost_sound, channel=1)
                 if pressed[pygame.K_a] and np.abs(self.body.velocity[1]) < 20:
                     move += pygame.Vector2((-1, 0)) * lateral_strength
                 if pressed[pygame.K_d] and np.abs(self.body.velocity[1]) < 20:
@@ -102,61 +118,76 @@ class Satellite(pygame.sprite.Sprite):
                                             }
             image_filename = self.satellite_images_health['high']
 
-        self.image = pygame.image.load(image_filename)
+        self.image = self.undamaged_image = load_image(image_filename, image_shape)
         self.is_geosynch = is_geosynch
         self.is_player = is_player
 
-        self.health = 6
-        if image_shape:
-            self.image = pygame.transform.scale(self.image, image_shape)
         self.rect = self.image.get_bounding_rect()
         width = self.rect.width
         height = self.rect.height
         self.space = space
-        self.pos = pygame.Vector2(init_pos)
+        self.pool = None
+        # index into the DebrisField arrays while the satellite is live debris
+        self.slot = None
 
         vs = [(-width / 2, -height / 2), (width / 2, -height / 2),
               (width / 2, height / 2), (-width / 2, height / 2)]
         moment = pymunk.moment_for_poly(mass, vs)
         self.body = pymunk.Body(mass, moment)
-        self.body.position = self.pos.x, -self.pos.y + 500
         self.shape = pymunk.Poly(self.body, vs)
         self.shape.friction = 0.5
+        self.shape.collision_type = COLLISION_GEOSYNCH if is_geosynch else COLLISION_DEBRIS
+        self.shape.sprite = self
+        # without a space the satellite is only built, for a pool to place later with reset
+        if space is not None:
+            self.reset(init_pos, init_velocity, init_angular_velocity)
+
+    def reset(self, init_pos, init_velocity=(0, 0), init_angular_velocity=0):
+        '''put the satellite back in the space as new, at init_pos'''
+        self.health = 6
+        self.image = self.undamaged_image
+        self.pos = pygame.Vector2(init_pos)
+        self.rect.center = self.pos
+        self.body.position = self.pos.x, -self.pos.y + 500
+        self.body.angle = 0
         self.body.velocity = init_velocity
         self.body.angular_velocity = init_angular_velocity
+        self.body.force = 0, 0
+        self.body.torque = 0
         self.space.add(self.body, self.shape)
+        self.previous_position, self.previous_angle = self.body.position, self.body.angle
 
     def update(self, events, dt, other_sprites=None):
         self.pos = pygame.Vector2(self.body.position[0], -self.body.position[1]+500)
         self.rect.center = self.pos
+        self.die(other_sprites)
 
-        non_player_sprites = other_sprites.copy()
-        non_player_sprites.remove(self)
-        is_collided = pygame.sprite.spritecollideany(self, non_player_sprites)
-        satellite_to_return = None
+    def damage(self):
+        '''take a hit from debris, returning True if this destroys a geosynch satellite'''
+        self.health -= 1
+        self.update_health_image()
+
+        if self.health < 0 and self.is_geosynch is True:
+            self.despawn()
+            return True
+        return False
 
+    def update_health_image(self):
         if self.satellite_images_health:
             if 3 < self.health <= 5:
-                self.image = pygame.image.load(self.satellite_images_health['med'])
+                self.image = load_image(self.satellite_images_health['med'])
             if self.health <= 3:
-                self.image = pygame.image.load(self.satellite_images_health['low'])
+                self.image = load_image(self.satellite_images_health['low'])
 
-        if is_collided and self.is_geosynch and is_collided.is_player is False and is_collided.is_geosynch is False:
-            self.health -= 1
-            is_collided.space.remove(is_collided.body, is_collided.shape)
-            is_collided.kill()
-
-        if self.health < 0 and self.is_geosynch is True:
-            self.space.remove(self.body, self.shape)
-            self.kill()
-            new_vect = pygame.Vector2(self.body.position[0], -self.body.position[1] + 500)
-            satellite_to_return = Satellite(self.space, resource_path("images/sputnik_custom.png"), init_pos=new_vect,
-                                            init_velocity=(0, 5), screen_height=self.screen_height)
-
-        self.die(other_sprites)
-        return satellite_to_return
+    def despawn(self):
+        '''take the satellite out of its groups and the space, and give it back to its pool'''
+        self.kill()
+        self.space.remove(self.body, self.shape)
+        if self.pool:
+            self.pool.release(self)
 
     def die(self, other_sprites):
+        if not self.alive():
+            return
         if self.rect.y > self.screen_height or self.rect.y < -100 or self.rect.x + 500 < other_sprites.sprites()[0].pos.x:
-            self.kill()
-            self.space.remove(self.body, self.shape)
+            self.despawn()
@@ -0,0 +1,39 @@
+import numpy as np
+
+
+class LevelTemplate:
+    '''the parts of a level that only depend on its parameters and seed, built once and kept for the next run'''
+    def __init__(self, key, background):
+        self.key = key
+        self.background = background
+        # geosynch satellite (x, y) positions by chunk start
+        self.layouts = {}
+
+
+class LevelStreamer:
+    '''builds the level in chunks from a seed as the view advances
+
+    Satellites are put to sleep in the space as they are built, and the space wakes them when something touches them.
+    Satellites left behind are removed by Satellite.die, like before.'''
+    def __init__(self, build_chunk, seed, start_x, end_x, chunk_width=1500, lookahead=1000):
+        # build_chunk(start_x, end_x, rng) returns the satellites it added to the space
+        self.build_chunk = build_chunk
+        self.seed = seed
+        self.end_x = end_x
+        self.chunk_width = chunk_width
+        self.lookahead = lookahead
+        self.next_x = start_x
+        self.next_chunk = 0
+
+    def update(self, view_left, view_right):
+        '''build chunks up to lookahead past view_right, returning the satellites built by this call'''
+        built = []
+        while self.next_x < min(view_right + self.lookahead, self.end_x):
+            chunk_end = min(self.next_x + self.chunk_width, self.end_x)
+            satellites = self.build_chunk(self.next_x, chunk_end, np.random.RandomState([self.seed, self.next_chunk]))
+            for satellite in satellites:
+                satellite.body.sleep()
+            built += satellites
+            self.next_x = chunk_end
+            self.next_chunk += 1
+        return built
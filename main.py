@@ -1,54 +1,112 @@
+import time
+START_TIME = time.perf_counter()
+
 import pygame as pg
+import argparse
+import collections
 import math
-import pygame
+import os
 import random
 import pymunk
 import numpy as np
-from pymunk import Vec2d
-from game_objects import Satellite, Player, resource_path
+from assets import audio, load_image, load_sound, preload, resource_path, rotation_cache
+from display import display
+from profiler import profiler
+from quality import quality
+from debris import DebrisField, DebrisPool, SPUTNIK_SIZES, GOLD_SATELLITE_SIZES
+from level import LevelStreamer, LevelTemplate
+from starfield import Starfield
+from game_objects import Player, COLLISION_PLAYER, COLLISION_GEOSYNCH, COLLISION_DEBRIS, \
+    get_body_state, set_body_state
 import sys
 
 
 class Control:
-    def __init__(self):
+    def __init__(self, physics_rate=60, max_substeps=5):
         self.done = False
         self.fps = 60
-        self.screen = pg.display.set_mode((500, 500))
+        self.physics_dt = 1. / physics_rate
+        self.max_substeps = max_substeps
+        self.accumulator = 0.
+        self.screen = display.get_screen()
         self.screen_rect = self.screen.get_rect()
         self.clock = pg.time.Clock()
 
     def setup_states(self, state_dict, start_state):
+        '''state_dict maps state names to factories, each state is only built the first time it is entered'''
         self.state_dict = state_dict
+        self.states = {}
         self.state_name = start_state
-        self.state = self.state_dict[self.state_name]
+        self.state = self.get_state(self.state_name)
+        self.state.startup()
+
+    def get_state(self, name):
+        if name not in self.states:
+            self.states[name] = self.state_dict[name]()
+        return self.states[name]
 
     def flip_state(self):
         self.state.done = False
         previous, self.state_name = self.state_name, self.state.next
         self.state.cleanup()
-        self.state = self.state_dict[self.state_name]
+        self.state = self.get_state(self.state_name)
         self.state.startup()
         self.state.previous = previous
 
     def update(self, dt):
+        '''advance the state in fixed physics steps covering dt, then draw it between the last two steps
+
+        Returns the rects the state redrew, or None if the whole screen changed.'''
         if self.state.quit:
             self.done = True
         elif self.state.done:
             self.flip_state()
-        self.state.update(self.screen, dt)
+            self.accumulator = 0.
+
+        self.accumulator += dt
+        substeps = 0
+        while self.accumulator >= self.physics_dt and substeps < self.max_substeps and not self.state.done:
+            self.state.fixed_update(self.physics_dt)
+            self.accumulator -= self.physics_dt
+            substeps += 1
+        if substeps == self.max_substeps:
+            # too far behind to catch up, drop the backlog rather than spiral
+            self.accumulator = min(self.accumulator, self.physics_dt)
+
+        if self.state.done:
+            return []
+        return self.state.draw(self.screen, self.accumulator / self.physics_dt)
 
     def event_loop(self):
         for event in pg.event.get():
             if event.type == pg.QUIT:
                 self.done = True
+            elif event.type == pg.KEYDOWN and event.key == pg.K_F3:
+                profiler.toggle_overlay()
+                self.state.invalidate()
+            elif event.type == pg.KEYDOWN and event.key == pg.K_F4:
+                profiler.dump_all()
             self.state.get_event(event)
 
     def main_game_loop(self):
+        first_frame = True
         while not self.done:
             delta_time = self.clock.tick(self.fps) / 1000.0
-            self.event_loop()
-            self.update(delta_time)
-            pg.display.update()
+            profiler.begin_frame()
+            with profiler.phase('events'):
+                self.event_loop()
+            dirty_rects = self.update(delta_time)
+            if profiler.show_overlay:
+                profiler.draw_overlay(self.screen)
+                dirty_rects = None
+            with profiler.phase('present'):
+                display.present(dirty_rects)
+            # ended after present, so the quality level also answers for scaling the frame to the window
+            profiler.end_frame()
+            quality.add_frame(float(profiler.current['total']))
+            if first_frame:
+                first_frame = False
+                print('time to first frame: {:.3f}s'.format(time.perf_counter() - START_TIME))
 
 
 class MenuManager:
@@ -58,29 +116,23 @@ class MenuManager:
         self.selected_color = (255, 255, 0)
         self.deselected_color = (255, 255, 255)
 
-    def draw_menu(self, screen):
-        '''handle drawing of the menu options'''
-        title_font = pg.font.SysFont("arial", 70)
-        title_rend = title_font.render('Catstronaut', 1, (200, 200, 250))
-        title_rect = title_rend.get_rect()
-        title_rect.center = (250, 50)
-
-        subtitle_font = pg.font.SysFont("arial", 40)
-        subtitle_rend = subtitle_font.render('To The Moon', 1, (200, 200, 250))
-        subtitle_rect = subtitle_rend.get_rect()
-        subtitle_rect.center = (250, 105)
-
-        screen.blit(title_rend, title_rect)
-        screen.blit(subtitle_rend, subtitle_rect)
+    def draw_title(self, screen):
+        for rend, rect in self.rendered_title:
+            screen.blit(rend, rect)
 
+    def draw_menu(self, screen):
+        '''handle drawing of the menu options, returning the area they can cover'''
+        dirty_rects = []
         for i, opt in enumerate(self.rendered["des"]):
             opt[1].center = (self.screen_rect.centerx, self.from_bottom + i * self.spacer)
+            rend_img, rend_rect = self.rendered["sel"][i]
+            rend_rect.center = opt[1].center
             if i == self.selected_index:
-                rend_img, rend_rect = self.rendered["sel"][i]
-                rend_rect.center = opt[1].center
                 screen.blit(rend_img, rend_rect)
             else:
                 screen.blit(opt[0], opt[1])
+            dirty_rects.append(rend_rect.union(opt[1]))
+        return dirty_rects
 
     def update_menu(self):
         self.mouse_hover_sound()
@@ -101,7 +153,7 @@ class MenuManager:
     def mouse_hover_sound(self):
         '''play sound when selected option changes'''
         for i, opt in enumerate(self.rendered["des"]):
-            if opt[1].collidepoint(pg.mouse.get_pos()):
+            if opt[1].collidepoint(display.mouse_pos()):
                 if self.last_option != opt:
                     self.last_option = opt
 
@@ -109,11 +161,25 @@ class MenuManager:
         '''select menu option '''
         if event.type == pg.MOUSEBUTTONDOWN and event.button == 1:
             for i, opt in enumerate(self.rendered["des"]):
-                if opt[1].collidepoint(pg.mouse.get_pos()):
+                if opt[1].collidepoint(display.mouse_pos()):
                     self.selected_index = i
                     self.select_option(i)
                     break
 
+    def pre_render_title(self):
+        '''setup render of the title and subtitle'''
+        title_font = pg.font.SysFont("arial", 70)
+        title_rend = title_font.render('Catstronaut', 1, (200, 200, 250))
+        title_rect = title_rend.get_rect()
+        title_rect.center = (self.screen_rect.centerx, 50)
+
+        subtitle_font = pg.font.SysFont("arial", 40)
+        subtitle_rend = subtitle_font.render('To The Moon', 1, (200, 200, 250))
+        subtitle_rect = subtitle_rend.get_rect()
+        subtitle_rect.center = (self.screen_rect.centerx, 105)
+
+        self.rendered_title = [(title_rend, title_rect), (subtitle_rend, subtitle_rect)]
+
     def pre_render_options(self):
         '''setup render menu options based on selected or deselected'''
         font_deselect = pg.font.SysFont("arial", 50)
@@ -141,7 +207,7 @@ class MenuManager:
     def change_selected_option(self, op=0):
         '''change highlighted menu option'''
         for i, opt in enumerate(self.rendered["des"]):
-            if opt[1].collidepoint(pg.mouse.get_pos()):
+            if opt[1].collidepoint(display.mouse_pos()):
                 self.selected_index = i
         if op:
             self.selected_index += op
@@ -160,6 +226,9 @@ class States(Control):
         self.quit = False
         self.previous = None
 
+    def invalidate(self):
+        '''forget what is on screen so the next draw redraws all of it'''
+
 
 class Menu(States, MenuManager):
     def __init__(self):
@@ -168,92 +237,260 @@ class Menu(States, MenuManager):
         self.next = 'game'
         self.options = ['Play', 'Quit']
         self.next_list = ['game']
+        self.pre_render_title()
         self.pre_render_options()
-        self.from_bottom = 200
+        # the menu was laid out at 500x500, other sizes keep it in the same place relative to the centre
+        self.from_bottom = self.screen_rect.centery - 50
         self.spacer = 75
-        self.startup()
 
     def cleanup(self):
         print('cleaning up Main Menu state stuff')
 
+    @staticmethod
+    def images():
+        return [(resource_path("images/catstronaut.png"), (3421//6, 1706//6)),
+                (resource_path('images/moon.png'), (100, 100))]
+
     def startup(self):
-        self.stars_x = np.random.randint(0, self.screen.get_width(), 1000)
-        self.stars_y = np.random.randint(0, self.screen.get_height(), 1000)
+        '''compose everything but the options into one layer, the options are all that change while idle'''
+        width, height = self.screen.get_size()
+        stars = Starfield(width, height, seed=np.random.randint(2 ** 31), tile_size=max(width, height),
+                          density=1000 / (width * height))
+        self.static_layer = stars.make_tile(0, 0)
+        cat_image = load_image(resource_path("images/catstronaut.png"), (3421//6, 1706//6))
+        moon_image = load_image(resource_path('images/moon.png'), (100, 100))
+        centerx, centery = self.screen_rect.center
+        self.static_layer.blit(cat_image, (centerx - 345, height - 280))
+        self.static_layer.blit(moon_image, (centerx + 50, centery - 140))
+        self.draw_title(self.static_layer)
+        self.drawn_index = None
 
     def get_event(self, event):
         if event.type == pg.QUIT:
             self.quit = True
         self.get_event_menu(event)
 
-    def update(self, screen, dt):
+    def invalidate(self):
+        self.drawn_index = None
+
+    def fixed_update(self, dt):
         self.update_menu()
-        self.draw(screen)
 
-    def draw(self, screen):
-        screen.fill((30, 30, 30))
-        for x, y in zip(self.stars_x, self.stars_y):
-            pygame.draw.rect(screen, (200, 200, 200), (x, y, 2, 2))
-        cat_image = pygame.image.load(resource_path("images/catstronaut.png"))
-        cat_image = pygame.transform.scale(cat_image, (3421//6, 1706//6))
-        moon_image = pg.image.load(resource_path('images/moon.png'))
-        moon_image = pygame.transform.scale(moon_image, (100, 100))
-        screen.blit(cat_image, (-95, 220))
-        screen.blit(moon_image, (300, 110))
-        self.draw_menu(screen)
+    def draw(self, screen, alpha=1.):
+        if self.drawn_index is None:
+            screen.blit(self.static_layer, (0, 0))
+            self.draw_menu(screen)
+            self.drawn_index = self.selected_index
+            return None
+        if self.drawn_index == self.selected_index:
+            return []
+
+        for (_, selected_rect), (_, deselected_rect) in zip(self.rendered["sel"], self.rendered["des"]):
+            rect = selected_rect.union(deselected_rect)
+            screen.blit(self.static_layer, rect, rect)
+        self.drawn_index = self.selected_index
+        return self.draw_menu(screen)
 
 
 class Game(States):
-    def __init__(self):
+    def __init__(self, level_end=3000, background_width=15000, seed=None, physics_iterations=10, spatial_hash=None):
         States.__init__(self)
         self.next = 'menu'
-        self.startup()
+        self.level_end = level_end
+        self.background_width = background_width
+        # seeds the level layout and background, drawn from random on every startup when None
+        self.seed = seed
+        # polled once per physics step for the held keys, replaced to drive the game without a keyboard
+        self.input = pg.key.get_pressed
+        self.pressed = collections.defaultdict(bool)
+        # replay.Recorder that saves every run when set
+        self.recorder = None
+        # sprites further than this off screen are not rotated or drawn
+        self.view_margin = 50
+        # where the camera keeps the player, up and left of the centre of the screen
+        self.player_screen_pos = pg.Vector2(self.screen_rect.center) - (40, 40)
+        # solver iterations per step, the quality scheduler can lower them further
+        self.physics_iterations = physics_iterations
+        # (cell size, cell count) to use pymunk's spatial hash broadphase instead of its bounding box tree
+        self.spatial_hash = spatial_hash
+        # kept between runs: the satellites of finished runs, and what the level last played was built from
+        self.debris_pool = None
+        self.template = None
+        self.space = None
+        self.background_height = 1500
+
+    @staticmethod
+    def preload_assets():
+        '''start decoding the images and sounds startup needs on a background thread'''
+        # the theme is streamed by pygame.mixer.music, so only the effects are decoded up front
+        sounds = [resource_path("sounds/rocket_boost.wav")]
+        return preload(Game.images(), sounds)
+
+    @staticmethod
+    def images():
+        '''(path, size, flip_x, flip_y) of every image a run loads, for preloading and baking'''
+        sputnik = resource_path("images/sputnik_custom.png")
+        gold_satellite = resource_path("images/gold_satellite.png")
+        images = [(resource_path("images/catstronaut.png"), (50, 30), True, True),
+                  (resource_path('images/earth.png'), (750, 750)),
+                  (resource_path('images/moon.png'), (200, 200)),
+                  (resource_path("images/satellite_large_high_health.png"), (100, 50)),
+                  (resource_path("images/satellite_large_med_health.png"),),
+                  (resource_path("images/satellite_large_low_health.png"),),
+                  (sputnik,)]
+        images += [(sputnik, (size, size)) for size in SPUTNIK_SIZES]
+        images += [(gold_satellite, (3 * size, size)) for size in GOLD_SATELLITE_SIZES]
+        return images
 
     def cleanup(self):
         print('cleaning up Game state stuff')
+        if self.recorder:
+            self.recorder.end()
+        self.release_world()
+
+    def release_world(self):
+        '''give the satellites of the run back to the pool and drop the rest of it'''
+        if self.space is None:
+            return
+        self.debris.clear()
+        for sprite in self.sprites.sprites():
+            if sprite is not self.player:
+                sprite.despawn()
+        # pymunk frees a space and the bodies in it in no set order once they are garbage, and a space freed after
+        # its bodies reads them, so leave nothing in it
+        self.space.remove(*self.space.shapes, *self.space.bodies)
         self.space = None
         self.player = None
         self.sprites = None
+        self.debris = None
+        self.level = None
 
     def startup(self):
-        pg.mixer.init(frequency=192000)
-        rocket_boost_sound = pg.mixer.Sound(resource_path("sounds/rocket_boost.wav"))
-        pg.mixer.Channel(0).set_volume(50)
-        pg.mixer.Channel(0).play(pygame.mixer.Sound(resource_path("sounds/space_theme.wav")), loops=-1)
+        if self.recorder:
+            self.recorder.begin(self)
+        self.start_audio()
 
         x_offset = 500
-        self.background_width = 15000
-        self.background_height = 1500
-        self.level_end = 3000
+        self.level_seed = self.seed if self.seed is not None else random.getrandbits(32)
+        self.load_template()
+        self.create_world()
 
+        self.player = self.create_player()
+        self.sprites = pg.sprite.Group(self.player)
+        start_satellite, = self.create_geosynch_satellites([(100 + x_offset, 50 + self.background_height / 2)])
+        start_satellite.body.sleep()
+        self.sprites.add(start_satellite)
+        self.level = LevelStreamer(self.build_level_chunk, self.level_seed, start_x=750,
+                                   end_x=x_offset + self.level_end)
+        self.stream_level()
+
+    def load_template(self):
+        '''reuse the last level template if the level parameters and seed are the same, otherwise build a new one'''
+        key = (self.level_end, self.background_width, self.background_height, self.level_seed)
+        if self.template is None or self.template.key != key:
+            background = Starfield(self.background_width, self.background_height, seed=self.level_seed)
+            # every run starts with the same view
+            background.pin(self.get_start_camera(), self.screen.get_size())
+            self.template = LevelTemplate(key, background)
+        self.background = self.template.background
+
+    def start_audio(self):
+        self.rocket_boost_sound = load_sound(resource_path("sounds/rocket_boost.wav"))
+        audio.play_music(resource_path("sounds/space_theme.wav"))
+
+    def create_world(self):
+        '''set up an empty physics space, with the debris pool and field that live in it'''
+        x_offset = 500
+        self.release_world()
         self.space = pymunk.Space()
         self.space.gravity = 0, 0
-        earth_image = pg.image.load(resource_path('images/earth.png'))
-        self.earth_image = pg.transform.scale(earth_image, (self.background_height // 2, self.background_height // 2))
+        # geosynch satellites sit still until something hits them, so they sleep and only cost anything while moving.
+        # Without gravity pymunk would only count a body as idle at exactly zero speed, so one knocked by debris would
+        # drift awake for the rest of the run
+        self.space.sleep_time_threshold = 1.
+        self.space.idle_speed_threshold = 5.
+        if self.spatial_hash:
+            cell_size, count = self.spatial_hash
+            self.space.use_spatial_hash(cell_size, int(count))
+        self.pending_hits = []
+        self.space.add_wildcard_collision_handler(COLLISION_PLAYER).post_solve = self.on_player_contact
+        self.space.add_collision_handler(COLLISION_GEOSYNCH, COLLISION_DEBRIS).post_solve = self.on_debris_hit
+        if self.debris_pool is None:
+            self.debris_pool = DebrisPool(self.space, capacity=256, screen_height=self.background_height)
+        self.debris_pool.space = self.space
+        for size in SPUTNIK_SIZES:
+            self.debris_pool.prefill(resource_path("images/sputnik_custom.png"), (size, size), count=8)
+        for size in GOLD_SATELLITE_SIZES:
+            self.debris_pool.prefill(resource_path("images/gold_satellite.png"), (3 * size, size), mass=5, count=4)
+        self.debris = DebrisField(self.debris_pool)
+        self.earth_image = load_image(resource_path('images/earth.png'),
+                                      (self.background_height // 2, self.background_height // 2))
         self.earth_center = (x_offset - 650, self.background_height / 2 - 300)
 
-        self.moon_image = pg.image.load(resource_path('images/moon.png'))
-        self.moon_image = pg.transform.scale(self.moon_image, (200, 200))
+        self.moon_image = load_image(resource_path('images/moon.png'), (200, 200))
         self.moon_center = (x_offset + self.level_end + 400, self.background_height / 2)
 
-        self.player = Player(self.space, init_pos=(90 + x_offset, self.background_height / 2 - 10),
-                             image_shape=[50, 30], moon_center=self.moon_center, boost_sound=rocket_boost_sound)
+    def create_player(self):
+        x_offset = 500
+        return Player(self.space, init_pos=(90 + x_offset, self.background_height / 2 - 10),
+                      image_shape=[50, 30], moon_center=self.moon_center, boost_sound=self.rocket_boost_sound,
+                      get_pressed=self.get_pressed)
 
+    def snapshot(self):
+        '''the state of the running level as plain data that can be saved as JSON, see restore'''
+        player = self.player
+        debris = [(satellite.pool_key, get_body_state(satellite.body)) for satellite in self.debris.group]
+        version, internal_state, gauss_next = random.getstate()
+        name, keys, position, has_gauss, cached_gaussian = np.random.get_state()
+        return {'random': (version, internal_state, gauss_next),
+                'np_random': (name, keys.tolist(), position, has_gauss, cached_gaussian),
+                'level_seed': self.level_seed,
+                'player': (get_body_state(player.body), player.can_jump, player.game_over, player.in_contact),
+                'geosynch': [(tuple(s.pos), get_body_state(s.body), s.health) for s in self.sprites if s.is_geosynch],
+                'level': (self.level.next_x, self.level.next_chunk),
+                'debris': [((os.path.relpath(path, resource_path('.')), shape, mass), state)
+                           for (path, shape, mass, _), state in debris],
+                }
+
+    def restore(self, snapshot):
+        '''rebuild the level from a snapshot, between physics steps
+
+        Bodies come back exactly, but the solver's cached contacts do not, so the simulation can drift slightly from
+        the run the snapshot was taken from.'''
+        self.start_audio()
+        self.level_seed = snapshot['level_seed']
+        self.load_template()
+        self.create_world()
+
+        self.player = self.create_player()
+        body_state, self.player.can_jump, self.player.game_over, self.player.in_contact = snapshot['player']
+        set_body_state(self.player.body, body_state)
+        self.player.pos = pg.Vector2(body_state[0][0], -body_state[0][1] + 500)
         self.sprites = pg.sprite.Group(self.player)
-        level_sprite_list = self.create_geosynch_satellites(self.space, self.background_height,
-                                                            screen_height=self.background_height,
-                                                            end_x=x_offset + self.level_end)
-
-        start_satellite = Satellite(self.space, init_pos=(100 + x_offset, 50 + self.background_height / 2), mass=500,
-                                    image_shape=(100, 50), is_geosynch=True, screen_height=self.background_height)
-        level_sprite_list.append(start_satellite)
-        self.sprites.add(*level_sprite_list)
-
-        self.background = pg.Surface((self.background_width, self.background_height))
-        self.background.fill((30, 30, 30))
 
-        for _ in range(80000):
-            x, y = random.randint(0, self.background_width), random.randint(0, self.background_height)
-            pg.draw.rect(self.background, (200, 200, 200), (x, y, 2, 2))
+        x_offset = 500
+        self.level = LevelStreamer(self.build_level_chunk, self.level_seed, start_x=750,
+                                   end_x=x_offset + self.level_end)
+        self.level.next_x, self.level.next_chunk = snapshot['level']
+        for satellite, (pos, body_state, health) in zip(
+                self.create_geosynch_satellites([pos for pos, _, _ in snapshot['geosynch']]), snapshot['geosynch']):
+            set_body_state(satellite.body, body_state)
+            satellite.health = health
+            satellite.update_health_image()
+            self.sprites.add(satellite)
+
+        for (path, shape, mass), body_state in snapshot['debris']:
+            satellite = self.debris_pool.acquire(resource_path(path), shape, mass)
+            set_body_state(satellite.body, body_state)
+            self.debris.add(satellite)
+
+        for s in self.sprites:
+            s.previous_position, s.previous_angle = s.body.position, s.body.angle
+        # snapshots come back from JSON with lists for tuples
+        version, internal_state, gauss_next = snapshot['random']
+        random.setstate((version, tuple(internal_state), gauss_next))
+        name, keys, position, has_gauss, cached_gaussian = snapshot['np_random']
+        np.random.set_state((name, np.array(keys, dtype=np.uint32), position, has_gauss, cached_gaussian))
 
     def get_event(self, event):
         if event.type == pg.QUIT:
@@ -263,56 +500,38 @@ class Game(States):
         """Small hack to convert chipmunk physics to pygame coordinates"""
         return -y + 600
 
-    def create_geosynch_satellites(self, space, background_height: float, screen_height: float, start_x: int = 750,
-                                   end_x: int = 8000, diff_x: int = 150):
-        geosynch_satellite_sprites = []
-
-        mass = 500
-        for x_pos in np.arange(start_x, end_x, diff_x):
-            y_pos = np.random.uniform(0.9 * background_height / 2, 1.1 * background_height / 2)
-            satellite = Satellite(space, init_pos=(x_pos, y_pos), mass=mass, image_shape=(100, 50),
-                                  is_geosynch=True, screen_height=screen_height)
-            geosynch_satellite_sprites.append(satellite)
-
-        return geosynch_satellite_sprites
-
-    def update(self, screen, dt):
-        moon_center = self.moon_center
-        moon_image = self.moon_image
-        earth_center = self.earth_center
-        earth_image = self.earth_image
-        level_end = self.level_end
-        player = self.player
-        background_height = self.background_height
-        space = self.space
-        sprites = self.sprites
-        x_offset = 500
-        events = pg.event.get()
-        if random.random() < 0.05 and player.pos.x < x_offset + level_end:
-            x_pos_max = player.pos.x + 750
-            if x_pos_max > x_offset + level_end:
-                x_pos_max = x_offset + level_end - 100
-            x_pos = np.random.uniform(player.pos.x - 10, x_pos_max)
-            init_velocity_x = np.random.uniform(-5, 5)
-            init_velocity_y = -100 - np.random.lognormal(1, 3 + player.pos.x / 500.)
-            init_velocity = (init_velocity_x, init_velocity_y)
-
-            if random.random() <= 0.8:
-                init_size = np.random.uniform(15, 25)
-                satellite = Satellite(space, resource_path("images/sputnik_custom.png"), init_pos=(x_pos, -10),
-                                      init_velocity=init_velocity,
-                                      screen_height=background_height, image_shape=(int(init_size), int(init_size)),
-                                      init_angular_velocity=np.random.uniform(-10, 10))
-            else:
-                init_size = np.random.uniform(35, 55)
-                satellite = Satellite(space, resource_path("images/gold_satellite.png"), init_pos=(x_pos, -10),
-                                      init_velocity=init_velocity,
-                                      screen_height=background_height,
-                                      image_shape=(int(3 * init_size), int(init_size)),
-                                      init_angular_velocity=np.random.uniform(-10, 10), mass=5)
-            sprites.add(satellite)
-
-        pressed = pg.key.get_pressed()
+    def geosynch_layout(self, start_x, end_x, diff_x=150, rng=np.random):
+        '''(x, y) of the geosynch satellites from start_x to end_x'''
+        x_pos = np.arange(start_x, end_x, diff_x)
+        y_pos = rng.uniform(0.9 * self.background_height / 2, 1.1 * self.background_height / 2, len(x_pos))
+        return list(zip(x_pos.tolist(), y_pos.tolist()))
+
+    def create_geosynch_satellites(self, layout):
+        '''take a geosynch satellite from the pool for every (x, y) in layout'''
+        return [self.debris_pool.acquire(None, (100, 50), mass=500, init_pos=pos, is_geosynch=True) for pos in layout]
+
+    def build_level_chunk(self, start_x, end_x, rng):
+        layouts = self.template.layouts
+        if start_x not in layouts:
+            layouts[start_x] = self.geosynch_layout(start_x, end_x, rng=rng)
+        satellites = self.create_geosynch_satellites(layouts[start_x])
+        self.sprites.add(*satellites)
+        return satellites
+
+    def stream_level(self):
+        view_left = self.player.pos.x - self.player_screen_pos.x
+        self.level.update(view_left, view_left + self.screen.get_width())
+
+    def get_pressed(self):
+        return self.pressed
+
+    def fixed_update(self, dt):
+        self.pressed = self.input()
+        with profiler.phase('spawn'):
+            self.stream_level()
+            self.spawn_debris()
+
+        pressed = self.pressed
         camera_move = pg.Vector2()
         if pressed[pg.K_UP]:
             camera_move += (0, 1)
@@ -324,45 +543,210 @@ class Game(States):
             camera_move += (-1, 0)
         if camera_move.length() > 0:
             camera_move.normalize_ip()
-        camera = pg.Vector2(-player.pos[0] + 210, -player.pos[1] + 210)
 
-        sprite_to_add = sprites.update(events, dt, sprites)
-        if sprite_to_add:
-            sprites.add(sprite_to_add)
+        with profiler.phase('update'):
+            self.update_sprites([], dt)
+        with profiler.phase('step'):
+            self.step_physics(dt)
+        self.check_game_over()
+
+    def interpolate(self, sprite, alpha):
+        '''body position and angle alpha of the way from the previous physics step to the current one'''
+        body = sprite.body
+        position = sprite.previous_position + (body.position - sprite.previous_position) * alpha
+        angle = sprite.previous_angle + (body.angle - sprite.previous_angle) * alpha
+        return position, angle
 
-        screen.blit(self.background, camera)
-        screen.blit(earth_image, earth_center + camera)
-        screen.blit(moon_image, moon_center + camera)
+    def get_camera(self, alpha=1.):
+        position, _ = self.interpolate(self.player, alpha)
+        return self.camera_at(position)
 
-        for s in sprites:
-            p = s.shape.body.position
-            p = Vec2d(p.x, self.flipy(p.y))
-            angle_degrees = math.degrees(s.shape.body.angle) + 180
-            rotated_logo_img = pg.transform.rotate(s.image, angle_degrees)
-            offset = Vec2d(rotated_logo_img.get_size()) / 2
-            p = p + camera - offset
+    def get_start_camera(self):
+        x_offset = 500
+        return self.camera_at(pg.Vector2(90 + x_offset, -(self.background_height / 2 - 10) + 500))
 
-            screen.blit(rotated_logo_img, p)
+    def camera_at(self, position):
+        return pg.Vector2(-position.x, position.y - 500) + self.player_screen_pos
 
-        pg.display.update()
-        dt = self.clock.tick(60)
-        space.step(dt / 1000)
+    def spawn_debris(self):
+        '''randomly drop a new piece of debris in front of the player'''
+        x_offset = 500
+        max_debris = quality.get('max_debris')
+        if random.random() < 0.05 and self.player.pos.x < x_offset + self.level_end and \
+                (max_debris is None or len(self.debris) < max_debris):
+            self.add_debris()
 
-        if player.pos[1] > 0.8 * self.background_height:
+    def add_debris(self, count=1):
+        player = self.player
+        x_offset = 500
+        x_pos_max = player.pos.x + 750
+        if x_pos_max > x_offset + self.level_end:
+            x_pos_max = x_offset + self.level_end - 100
+        self.debris.spawn(count, player.pos.x - 10, x_pos_max, player.pos.x)
+
+    def update_sprites(self, events, dt):
+        self.sprites.update(events, dt, self.sprites)
+
+    def step_physics(self, dt):
+        for s in self.sprites:
+            s.previous_position, s.previous_angle = s.body.position, s.body.angle
+        self.debris.save_previous()
+        self.player.in_contact = False
+        # a sleeping player would stop getting contact callbacks and lose its grip on the satellite it stands on
+        self.player.body.activate()
+        self.space.iterations = min(self.physics_iterations, quality.get('iterations'))
+        self.space.step(dt)
+        self.debris.sync()
+        self.apply_hits()
+        self.debris.cull(self.player.pos.x, self.background_height)
+
+    def on_player_contact(self, arbiter, space, data):
+        arbiter.shapes[0].sprite.in_contact = True
+
+    def on_debris_hit(self, arbiter, space, data):
+        '''queue the hit, bodies can't be removed from the space while it is stepping'''
+        geosynch_shape, debris_shape = arbiter.shapes
+        self.pending_hits.append((geosynch_shape.sprite, debris_shape.sprite))
+
+    def apply_hits(self):
+        # the pool can hand a satellite removed by an earlier hit straight back as a wreck, alive again, so hits
+        # queued on anything removed in this batch are skipped by identity rather than by alive()
+        removed = set()
+        for satellite, debris in self.pending_hits:
+            if satellite in removed or debris in removed or not satellite.alive() or not debris.alive():
+                continue
+            self.debris.remove(debris)
+            removed.add(debris)
+            if satellite.damage():
+                removed.add(satellite)
+                position = satellite.body.position
+                wreck = self.debris_pool.acquire(resource_path("images/sputnik_custom.png"),
+                                                 init_pos=(position.x, -position.y + 500), init_velocity=(0, 5))
+                self.debris.add(wreck)
+        self.pending_hits.clear()
+
+    def check_game_over(self):
+        if self.player.pos[1] > 0.8 * self.background_height:
             self.cleanup()
             self.done = True
 
-    def draw(self, screen):
-        screen.fill((0, 0, 255))
-
-
-pg.init()
-app = Control()
-state_dict = {
-    'menu': Menu(),
-    'game': Game(),
-}
-app.setup_states(state_dict, 'menu')
-app.main_game_loop()
-pg.quit()
-sys.exit()
+    def draw(self, screen, alpha=1.):
+        camera = self.get_camera(alpha)
+        view = screen.get_rect()
+        with profiler.phase('background'):
+            self.background.draw(screen, camera)
+            screen.blits([(image, center + camera) for image, center in ((self.earth_image, self.earth_center),
+                                                                         (self.moon_image, self.moon_center))
+                          if view.colliderect(image.get_rect(topleft=center + camera))], doreturn=False)
+
+        with profiler.phase('sprites'):
+            rotations = rotation_cache.misses
+            n_drawn = self.draw_sprites(screen, camera, alpha)
+        profiler.count('n_sprites', len(self.sprites) + len(self.debris))
+        profiler.count('n_drawn', n_drawn)
+        profiler.count('n_bodies', len(self.space.bodies))
+        profiler.count('n_rotations', rotation_cache.misses - rotations)
+        profiler.count('quality', quality.level)
+
+    def draw_sprites(self, screen, camera, alpha):
+        '''rotate and blit, in one batch, the sprites and debris within view_margin of the screen
+
+        Returns the number drawn.'''
+        width, height = screen.get_size()
+        margin = self.view_margin
+        blits = []
+        for s in self.sprites:
+            p, angle = self.interpolate(s, alpha)
+            x, y = p.x + camera.x, self.flipy(p.y) + camera.y
+            # half the diagonal bounds the sprite at any angle
+            radius = math.hypot(*s.image.get_size()) / 2 + margin
+            if x + radius < 0 or x - radius > width or y + radius < 0 or y - radius > height:
+                continue
+            angle_degrees = math.degrees(angle) + 180
+            rotated_logo_img, offset = rotation_cache.get(s.image, angle_degrees)
+            blits.append((rotated_logo_img, (x - offset[0], y - offset[1])))
+
+        slots, positions, angles = self.debris.interpolate(alpha)
+        xs = positions[:, 0] + camera.x
+        ys = self.flipy(positions[:, 1]) + camera.y
+        sizes = self.debris.sizes[slots]
+        radii = np.hypot(sizes[:, 0], sizes[:, 1]) / 2 + margin
+        visible = (xs + radii >= 0) & (xs - radii <= width) & (ys + radii >= 0) & (ys - radii <= height)
+        slots, xs, ys, angles, sizes = slots[visible], xs[visible], ys[visible], angles[visible], sizes[visible]
+        angles_degrees = np.degrees(angles) + 180
+        # small debris is drawn unrotated at lower quality levels
+        rotate = sizes.max(axis=1) >= quality.get('min_rotated_size')
+        satellites = self.debris.satellites
+        for slot, x, y, angle_degrees, is_rotated in zip(slots.tolist(), xs.tolist(), ys.tolist(),
+                                                         angles_degrees.tolist(), rotate.tolist()):
+            image = satellites[slot].image
+            if is_rotated:
+                image, offset = rotation_cache.get(image, angle_degrees)
+            else:
+                offset = (image.get_width() / 2, image.get_height() / 2)
+            blits.append((image, (x - offset[0], y - offset[1])))
+
+        screen.blits(blits, doreturn=False)
+        return len(blits)
+
+
+def size(text):
+    '''parse WxH'''
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--record', action='store_true', help='save every run to a replay file')
+    parser.add_argument('--audio-rate', type=int, default=44100, help='mixer sample rate in Hz')
+    parser.add_argument('--audio-buffer', type=int, default=512, help='mixer buffer size in samples')
+    parser.add_argument('--no-audio', action='store_true', help='run without opening the mixer')
+    parser.add_argument('--resolution', type=size, default=(500, 500), help='size the game is drawn at, as WxH')
+    parser.add_argument('--window', type=size, default=None, help='window size as WxH, defaults to the resolution')
+    parser.add_argument('--smooth', action='store_true', help='scale smoothly to fill the window instead of by whole '
+                                                                'multiples of the resolution')
+    parser.add_argument('--frame-budget', type=float, default=1000 / 60.,
+                        help='frame time in ms to lower quality above, 0 keeps full quality')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='level layout and background seed, drawn once per session when not given')
+    args = parser.parse_args()
+    # every run of a session plays the same level, so restarts reuse its cached template
+    seed = args.seed if args.seed is not None else random.getrandbits(32)
+
+    quality.budget = args.frame_budget / 1000
+    quality.enabled = args.frame_budget > 0
+    # a replay is simulated at full quality, so only let the recorded run lower quality in ways that don't change it
+    quality.simulation = not args.record
+
+    audio.configure(frequency=args.audio_rate, buffer=args.audio_buffer)
+    display.configure(args.resolution, args.window, args.smooth)
+    pg.init()
+    # pg.init opens the mixer whatever pre_init was given, so disabling has to come after it to close it again
+    audio.configure(enabled=not args.no_audio)
+    app = Control()
+    recorder = None
+    if args.record:
+        # replay sets the dummy SDL drivers for headless playback when imported, so only import it once the display is up
+        from replay import Recorder
+        recorder = Recorder(physics_rate=round(1 / app.physics_dt))
+
+    def create_game():
+        game = Game(seed=seed)
+        game.recorder = recorder
+        return game
+
+    state_dict = {
+        'menu': Menu,
+        'game': create_game,
+    }
+    app.setup_states(state_dict, 'menu')
+    Game.preload_assets()
+    app.main_game_loop()
+    app.state.cleanup()
+    pg.quit()
+    sys.exit()
+
+
+if __name__ == '__main__':
+    main()
@@ -6,7 +6,7 @@ import pymunk
 a = Analysis(['main.py'],
              pathex=['C:\\Users\\Mark\\Documents\\Python Scripts\\gamejam_2020_moonshot'],
              binaries=[ (pymunk.chipmunk_path, '.')],
-             datas=[('sounds/*.wav','sounds'),('images/*.png','images')],
+             datas=[('sounds/*.wav','sounds'),('images/*.png','images'),('assets.pack','.')],
              hiddenimports=[],
              hookspath=[],
              runtime_hooks=[],
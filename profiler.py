@@ -0,0 +1,102 @@
+import contextlib
+import csv
+import json
+import time
+import numpy as np
+import pygame
+
+
+PHASES = ('events', 'spawn', 'update', 'step', 'background', 'sprites', 'present')
+COUNTS = ('n_sprites', 'n_drawn', 'n_bodies', 'n_rotations', 'quality')
+
+
+class FrameProfiler:
+    '''per-frame phase timings (in seconds) and counts, kept in a fixed-size ring buffer'''
+    def __init__(self, size=600):
+        self.dtype = [('frame', np.int64), ('total', np.float64)] + [(phase, np.float64) for phase in PHASES] + \
+                     [(name, np.int64) for name in COUNTS]
+        self.samples = np.zeros(size, dtype=self.dtype)
+        self.current = np.zeros((), dtype=self.dtype)
+        self.frame = 0
+        self.frame_start = None
+        self.show_overlay = False
+        self.font = None
+
+    def begin_frame(self):
+        self.current = np.zeros((), dtype=self.dtype)
+        self.frame_start = time.perf_counter()
+
+    def end_frame(self):
+        if self.frame_start is None:
+            return
+        self.current['frame'] = self.frame
+        self.current['total'] = time.perf_counter() - self.frame_start
+        self.samples[self.frame % len(self.samples)] = self.current
+        self.frame += 1
+        self.frame_start = None
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        '''time the body of the with block, adding to the phase if it runs more than once a frame'''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.current[name] += time.perf_counter() - start
+
+    def count(self, name, value):
+        self.current[name] = value
+
+    def recent(self):
+        '''the recorded samples, oldest first'''
+        size = len(self.samples)
+        if self.frame <= size:
+            return self.samples[:self.frame].copy()
+        return np.roll(self.samples, -(self.frame % size))
+
+    def dump(self, path):
+        '''write the buffer to path, as JSON if it ends with .json and CSV otherwise'''
+        samples = self.recent()
+        names = samples.dtype.names
+        if path.endswith('.json'):
+            with open(path, 'w') as f:
+                json.dump([dict(zip(names, row.tolist())) for row in samples], f)
+        else:
+            with open(path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(names)
+                writer.writerows(row.tolist() for row in samples)
+        return path
+
+    def dump_all(self):
+        stem = time.strftime('profile_%Y%m%d_%H%M%S')
+        for path in (stem + '.csv', stem + '.json'):
+            print('wrote', self.dump(path))
+
+    def toggle_overlay(self):
+        self.show_overlay = not self.show_overlay
+
+    def draw_overlay(self, screen):
+        '''draw the last frame, mean and max over the buffer for each phase in the top left corner'''
+        samples = self.recent()
+        if not len(samples):
+            return
+        if self.font is None:
+            self.font = pygame.font.SysFont('monospace', 12)
+
+        lines = ['{:<10} {:>6} {:>6} {:>6}'.format('ms', 'last', 'mean', 'max')]
+        for name in ('total',) + PHASES:
+            values = samples[name] * 1000
+            lines.append('{:<10} {:6.2f} {:6.2f} {:6.2f}'.format(name, values[-1], values.mean(), values.max()))
+        for name in COUNTS:
+            lines.append('{:<10} {:6d}'.format(name, samples[name][-1]))
+
+        line_height = self.font.get_linesize()
+        rendered = [self.font.render(line, True, (255, 255, 255)) for line in lines]
+        width = max(r.get_width() for r in rendered) + 8
+        screen.fill((0, 0, 0), (0, 0, width, line_height * len(lines) + 8))
+        for i, r in enumerate(rendered):
+            screen.blit(r, (4, 4 + i * line_height))
+
+
+profiler = FrameProfiler()
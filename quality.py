@@ -0,0 +1,64 @@
+import collections
+import time
+import numpy as np
+from assets import rotation_cache
+
+
+# from full quality down. max_debris caps the live debris spawn_debris tops up to (None for no cap), rotation_step is
+# the rotation cache angle step in degrees, sprites whose largest side is under min_rotated_size are drawn unrotated
+# and iterations is the number of physics solver iterations
+LEVELS = (
+    {'max_debris': None, 'rotation_step': 2, 'min_rotated_size': 0, 'iterations': 10},
+    {'max_debris': 150, 'rotation_step': 4, 'min_rotated_size': 0, 'iterations': 8},
+    {'max_debris': 100, 'rotation_step': 8, 'min_rotated_size': 20, 'iterations': 6},
+    {'max_debris': 60, 'rotation_step': 15, 'min_rotated_size': 25, 'iterations': 4},
+)
+# settings that change the outcome of the simulation rather than just how it is drawn
+SIMULATION_SETTINGS = ('max_debris', 'iterations')
+
+
+class QualityScheduler:
+    '''steps quality down a level while recent frames take longer than budget and back up when there is headroom
+
+    With simulation False only the drawing settings change, so a recorded run can be replayed exactly.'''
+    def __init__(self, budget=1 / 60., window=60, headroom=0.6, levels=LEVELS, enabled=True, simulation=True):
+        self.budget = budget
+        self.headroom = headroom
+        self.levels = levels
+        self.enabled = enabled
+        self.simulation = simulation
+        self.frame_times = collections.deque(maxlen=window)
+        self.level = 0
+        # (time, old level, new level, mean frame time) for every change
+        self.changes = []
+
+    def get(self, name):
+        '''the current value of a setting in LEVELS'''
+        if name in SIMULATION_SETTINGS and not self.simulation:
+            return self.levels[0][name]
+        return self.levels[self.level][name]
+
+    def add_frame(self, frame_time):
+        '''record how long the last frame took to update and draw, changing level once a full window says so'''
+        if not self.enabled:
+            return
+        self.frame_times.append(frame_time)
+        if len(self.frame_times) < self.frame_times.maxlen:
+            return
+        mean = np.mean(self.frame_times)
+        if mean > self.budget and self.level < len(self.levels) - 1:
+            self.set_level(self.level + 1, mean)
+        elif mean < self.headroom * self.budget and self.level > 0:
+            self.set_level(self.level - 1, mean)
+
+    def set_level(self, level, frame_time=0.):
+        print('quality {} -> {}, mean frame {:.1f} ms against a {:.1f} ms budget'.format(
+            self.level, level, frame_time * 1000, self.budget * 1000))
+        self.changes.append((time.time(), self.level, level, frame_time))
+        self.level = level
+        rotation_cache.step = self.get('rotation_step')
+        # judge the new level on frames drawn with it only
+        self.frame_times.clear()
+
+
+quality = QualityScheduler()
@@ -0,0 +1,213 @@
+"""Record play sessions as a seed plus one byte of held keys per physics step, and replay them headless.
+
+A replay file is a fixed header followed by the input stream, and is read through a memory map. Snapshots of the game
+state taken every few hundred steps go in a sidecar file (<replay>.snapshots) so playback can seek close to any step
+without simulating from the start. Replaying at full speed through Game.fixed_update times every step:
+
+    python replay.py replay_20201206_120000.msr --seek 1800 --frames 300 --render
+"""
+import os
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import argparse
+import bisect
+import collections
+import json
+import mmap
+import random
+import struct
+import time
+import numpy as np
+import pygame as pg
+
+from assets import audio
+
+
+MAGIC = b'MSRP'
+VERSION = 1
+# magic, version, physics rate, rng seed, level seed (NO_SEED when the game drew it), level_end, background_width,
+# snapshot interval, number of steps
+HEADER = struct.Struct('<4sHHIIIIII')
+NO_SEED = 0xffffffff
+
+# bit of each key in the per-step input byte, W/A/D move the player and the arrows are read for the camera
+KEYS = (pg.K_w, pg.K_a, pg.K_d, pg.K_UP, pg.K_LEFT, pg.K_DOWN, pg.K_RIGHT)
+
+
+def encode_keys(pressed):
+    bits = 0
+    for bit, key in enumerate(KEYS):
+        if pressed[key]:
+            bits |= 1 << bit
+    return bits
+
+
+def decode_keys(bits):
+    return collections.defaultdict(bool, {key: True for bit, key in enumerate(KEYS) if bits & (1 << bit)})
+
+
+class Recorder:
+    '''writes every run of a Game to its own replay file, set it as game.recorder before startup'''
+    def __init__(self, directory='.', snapshot_interval=300, physics_rate=60):
+        self.directory = directory
+        self.snapshot_interval = snapshot_interval
+        self.physics_rate = physics_rate
+        self.file = None
+        self.path = None
+
+    def begin(self, game):
+        '''seed the random number generators and start a new file, called at the start of Game.startup'''
+        if self.file:
+            self.end()
+        self.seed = random.SystemRandom().getrandbits(32)
+        # pooled satellites carry solver state from earlier runs, so every recording starts from a new pool, as its
+        # replay does
+        game.debris_pool = None
+        random.seed(self.seed)
+        np.random.seed(self.seed)
+        stem = os.path.join(self.directory, time.strftime('replay_%Y%m%d_%H%M%S'))
+        self.path = stem + '.msr'
+        # runs can end and start again within a second
+        n = 1
+        while os.path.exists(self.path):
+            self.path = '{}_{}.msr'.format(stem, n)
+            n += 1
+        self.file = open(self.path, 'wb')
+        self.header = [MAGIC, VERSION, self.physics_rate, self.seed, NO_SEED if game.seed is None else game.seed,
+                       game.level_end, game.background_width, self.snapshot_interval]
+        self.file.write(HEADER.pack(*self.header, 0))
+        self.steps = 0
+        self.snapshots = []
+        self.game = game
+        self.keyboard = game.input
+        game.input = self.read_input
+
+    def read_input(self):
+        '''take a snapshot every snapshot_interval steps, then record and return the held keys'''
+        if self.steps % self.snapshot_interval == 0:
+            self.snapshots.append((self.steps, self.game.snapshot()))
+        pressed = self.keyboard()
+        self.file.write(bytes((encode_keys(pressed),)))
+        self.steps += 1
+        return pressed
+
+    def end(self):
+        if not self.file:
+            return
+        self.file.seek(0)
+        self.file.write(HEADER.pack(*self.header, self.steps))
+        self.file.close()
+        self.file = None
+        with open(self.path + '.snapshots', 'w') as f:
+            json.dump(self.snapshots, f)
+        self.game.input = self.keyboard
+        print('recorded {} steps to {}'.format(self.steps, self.path))
+
+
+class Replay:
+    '''a recorded session, with its input stream memory-mapped'''
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.physics_rate, self.seed, level_seed, self.level_end, self.background_width,
+         self.snapshot_interval, n_steps) = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('{} is not a version {} replay'.format(path, VERSION))
+        self.level_seed = None if level_seed == NO_SEED else level_seed
+        self.inputs = np.frombuffer(self.map, dtype=np.uint8, count=n_steps, offset=HEADER.size)
+        self.decoded = [decode_keys(bits) for bits in range(1 << len(KEYS))]
+
+        self.snapshots = []
+        if os.path.exists(path + '.snapshots'):
+            # JSON rather than pickle, so a replay sent in by a player can't run code when it is opened
+            with open(path + '.snapshots') as f:
+                self.snapshots = json.load(f)
+        self.snapshot_steps = [step for step, _ in self.snapshots]
+        self.game = None
+        self.step = 0
+
+    def __len__(self):
+        return len(self.inputs)
+
+    def create_game(self):
+        from main import Game
+
+        self.game = Game(level_end=self.level_end, background_width=self.background_width, seed=self.level_seed)
+        self.game.input = self.read_input
+        return self.game
+
+    def read_input(self):
+        return self.decoded[self.inputs[self.step]]
+
+    def seek(self, step):
+        '''bring the game to the start of step, from the nearest snapshot before it unless already on the way
+
+        A step past the end of the replay stops at the end.'''
+        step = min(step, len(self))
+        if self.game is None:
+            self.create_game()
+        i = bisect.bisect_right(self.snapshot_steps, step) - 1
+        snapshot_step = self.snapshot_steps[i] if i >= 0 else 0
+        running = getattr(self.game, 'space', None) is not None and not self.game.done
+        if not (running and snapshot_step <= self.step <= step):
+            self.game.done = False
+            # a new pool, like the recording's
+            self.game.release_world()
+            self.game.debris_pool = None
+            if snapshot_step > 0:
+                self.step, snapshot = self.snapshots[i]
+                self.game.restore(snapshot)
+            else:
+                # the first steps are cheap to simulate and a fresh startup matches the recording exactly
+                random.seed(self.seed)
+                np.random.seed(self.seed)
+                self.game.startup()
+                self.step = 0
+        while self.step < step and not self.game.done:
+            self.advance()
+
+    def advance(self, render=False):
+        self.game.fixed_update(1. / self.physics_rate)
+        self.step += 1
+        if render and not self.game.done:
+            self.game.draw(self.game.screen)
+
+    def play(self, frames=None, render=False):
+        '''run from the current step as fast as possible, returning the time each step took in milliseconds'''
+        end = len(self) if frames is None else min(self.step + frames, len(self))
+        timings = []
+        while self.step < end and not self.game.done:
+            start = time.perf_counter()
+            self.advance(render)
+            timings.append((time.perf_counter() - start) * 1000)
+        return np.array(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path')
+    parser.add_argument('--seek', type=int, default=0, help='step to start timing from')
+    parser.add_argument('--frames', type=int, default=None, help='number of steps to time, defaults to the rest')
+    parser.add_argument('--render', action='store_true', help='draw every step too')
+    args = parser.parse_args()
+
+    pg.init()
+    audio.configure(enabled=False)
+    replay = Replay(args.path)
+    start = time.perf_counter()
+    replay.seek(args.seek)
+    print('seeked to step {} in {:.3f}s'.format(replay.step, time.perf_counter() - start))
+    first_step = replay.step
+    timings = replay.play(args.frames, render=args.render)
+    if len(timings):
+        p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+        print('{} steps, {:.0f} steps/sec, p50 {:.3f} ms  p95 {:.3f} ms  p99 {:.3f} ms, slowest at step {}'.format(
+            len(timings), len(timings) / (timings.sum() / 1000), p50, p95, p99, first_step + int(timings.argmax())))
+    replay.game.release_world()
+    pg.quit()
+
+
+if __name__ == '__main__':
+    main()
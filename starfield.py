@@ -0,0 +1,85 @@
+import collections
+import numpy as np
+import pygame
+
+
+class Starfield:
+    '''star background that is generated in fixed-size tiles as they come into view
+
+    Each tile is generated from the seed and its tile coordinates, so a tile that is evicted and later needed again
+    looks exactly the same.'''
+    def __init__(self, width, height, seed=0, tile_size=512, density=80000 / (15000 * 1500), star_size=2,
+                 background_color=(30, 30, 30), star_color=(200, 200, 200), max_tiles=24, evict_distance=1000):
+        self.width = width
+        self.height = height
+        self.seed = seed
+        self.tile_size = tile_size
+        self.density = density
+        self.star_size = star_size
+        self.background_color = background_color
+        self.star_color = star_color
+        self.max_tiles = max_tiles
+        self.evict_distance = evict_distance
+        self.tiles = collections.OrderedDict()
+        # tiles kept out of eviction, see pin
+        self.pinned = {}
+
+    def make_tile(self, tile_x, tile_y):
+        width = min(self.tile_size, self.width - tile_x * self.tile_size)
+        height = min(self.tile_size, self.height - tile_y * self.tile_size)
+        rng = np.random.RandomState([self.seed, tile_x, tile_y])
+        n_stars = rng.poisson(self.density * width * height)
+        xs = rng.randint(0, width, n_stars)
+        ys = rng.randint(0, height, n_stars)
+
+        tile = pygame.Surface((width, height))
+        tile.fill(self.background_color)
+        pixels = pygame.surfarray.pixels3d(tile)
+        for dx in range(self.star_size):
+            for dy in range(self.star_size):
+                inside = (xs + dx < width) & (ys + dy < height)
+                pixels[xs[inside] + dx, ys[inside] + dy] = self.star_color
+        del pixels
+        return tile
+
+    def get_tile(self, tile_x, tile_y):
+        key = (tile_x, tile_y)
+        tile = self.pinned.get(key)
+        if tile is not None:
+            return tile
+        tile = self.tiles.get(key)
+        if tile is None:
+            tile = self.tiles[key] = self.make_tile(tile_x, tile_y)
+        else:
+            self.tiles.move_to_end(key)
+        return tile
+
+    def visible_tiles(self, camera, view_size):
+        '''yield (tile_x, tile_y) for every tile overlapping the view, camera is the world to screen offset'''
+        left, top = -camera[0], -camera[1]
+        right, bottom = left + view_size[0], top + view_size[1]
+        first_x = max(int(left // self.tile_size), 0)
+        first_y = max(int(top // self.tile_size), 0)
+        last_x = min(int((right - 1) // self.tile_size), (self.width - 1) // self.tile_size)
+        last_y = min(int((bottom - 1) // self.tile_size), (self.height - 1) // self.tile_size)
+        for tile_x in range(first_x, last_x + 1):
+            for tile_y in range(first_y, last_y + 1):
+                yield tile_x, tile_y
+
+    def pin(self, camera, view_size):
+        '''generate the tiles in view and keep them for good, for a view that is shown again on every run'''
+        for tile_x, tile_y in self.visible_tiles(camera, view_size):
+            self.pinned[tile_x, tile_y] = self.get_tile(tile_x, tile_y)
+
+    def draw(self, screen, camera):
+        screen.blits([(self.get_tile(tile_x, tile_y),
+                       (tile_x * self.tile_size + camera[0], tile_y * self.tile_size + camera[1]))
+                      for tile_x, tile_y in self.visible_tiles(camera, screen.get_size())], doreturn=False)
+        self.evict(-camera[0] - self.evict_distance)
+
+    def evict(self, min_x):
+        '''drop tiles that ended left of min_x, and the least recently used ones above max_tiles'''
+        for key in [key for key in self.tiles if (key[0] + 1) * self.tile_size < min_x]:
+            del self.tiles[key]
+        while len(self.tiles) > self.max_tiles:
+            self.tiles.popitem(last=False)